@@ -1,12 +1,13 @@
 from typing import List, Optional
 
 from dependencies import APIKey, JwtAuthentication, get_api_key, get_db
+from extraction_executor import extraction_executor
 from fastapi import APIRouter, Depends, HTTPException, Request
-from helpers import extract_glossary, transcript_data
+from fastapi.responses import JSONResponse
+from helpers import extract_biterms as run_biterm_extraction, extract_glossary, transcript_data
 from models import Glossary
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from tm2tb import BitermExtractor
 
 
 class RequestData(BaseModel):
@@ -29,6 +30,18 @@ class RequestData(BaseModel):
         Minimum similarity value of source and target terms. The default is 0.9
     filter_stopwords: bool
         Optional boolean value. The default is True.
+    match_policy: str
+        Optional value. The default is "all". If "longest", only the longest non-overlapping pattern matches are kept.
+    ranking: str
+        Optional value. The default is "simple". If "mmr", the terms are ranked with Maximal Marginal Relevance:
+        the top_n most relevant and diverse terms keep their rank and the rank of the other terms is halved.
+    top_n: int
+        Optional value. Number of terms selected by the "mmr" ranking. The default is half of the terms.
+    diversity: float
+        Optional value between 0 and 1. Weight of diversity in the "mmr" ranking. The default is 0.9
+    cluster_method: str
+        Optional value. The default is "kmeans". One of "kmeans", "minibatch", "agglomerative", "leader",
+        "auto" (kmeans, or minibatch for large term sets), or null to skip clustering (all clusters are -1).
     collapse_lemmas: bool
         Optional value. The default is True. The results will be reduced by looking at their lower-case lemmas.
     return_unmatched_terms: bool
@@ -46,6 +59,11 @@ class RequestData(BaseModel):
     similarity_min: Optional[float] = 0.9
     filter_stopwords: Optional[bool] = True
     include_entities: Optional[bool] = False
+    match_policy: Optional[str] = "all"
+    ranking: Optional[str] = "simple"
+    top_n: Optional[int] = None
+    diversity: Optional[float] = 0.9
+    cluster_method: Optional[str] = "kmeans"
     collapse_lemmas: Optional[bool] = True
     return_unmatched_terms: Optional[bool] = True
     mt_unmatched_terms: Optional[bool] = False
@@ -127,23 +145,27 @@ async def extract_biterms(data: RequestData, api_key: APIKey = Depends(get_api_k
         # Make a list of tuples (src_text, tgt_text) from the request data dict
         bitext_data = list(zip(data.src_texts, data.tgt_texts))
 
-        # Instantiate extractor and pass the list of tuples
-        extractor = BitermExtractor(
-            bitext_data, src_lang=data.src_lang, tgt_lang=data.tgt_lang
-        )
-        # Extract terms
-        biterms = extractor.extract_terms(
+        # Extract terms outside the event loop
+        biterms_dict = await extraction_executor.run(
+            run_biterm_extraction,
+            bitext_data,
+            data.src_lang,
+            data.tgt_lang,
             freq_min=data.freq_min,
             span_range=data.span_range,
             filter_stopwords=data.filter_stopwords,
             similarity_min=data.similarity_min,
             include_entities=data.include_entities,
+            match_policy=data.match_policy,
+            ranking=data.ranking,
+            top_n=data.top_n,
+            diversity=data.diversity,
+            cluster_method=data.cluster_method,
             collapse_lemmas=data.collapse_lemmas,
             return_unmatched_terms=data.return_unmatched_terms,
             mt_unmatched_terms=data.mt_unmatched_terms,
+            as_columns=True,
         )
-
-        biterms_dict = biterms.to_dict(orient="list")
     except ValueError as e:
         if str(e) == "No terms found." or str(e) == "No biterms found.":
             biterms_dict = {
@@ -160,7 +182,8 @@ async def extract_biterms(data: RequestData, api_key: APIKey = Depends(get_api_k
         else:
             raise HTTPException(status_code=422, detail=str(e))
 
-    return biterms_dict
+    # The columns are already plain lists, skip the response model validation
+    return JSONResponse(biterms_dict)
 
 
 @router.post("/meetings/{meeting_id}/glossary", response_model=ResponseData)
@@ -189,7 +212,8 @@ async def glossary(
         source_transcript = transcript_data(db, meeting_id, data.source_lang)
         target_transcript = transcript_data(db, meeting_id, data.target_lang)
         if source_transcript and target_transcript:
-            biterms_dict = extract_glossary(
+            biterms_dict = await extraction_executor.run(
+                extract_glossary,
                 [source_transcript],
                 [target_transcript],
                 data.source_lang,
@@ -203,6 +227,6 @@ async def glossary(
                 status_code=404,
                 detail=("source or target transcript not found for this meeting"),
             )
-        return biterms_dict
+        return JSONResponse(biterms_dict)
     else:
         raise HTTPException(status_code=401, detail=("access denied"))
@@ -1,6 +1,7 @@
 from typing import List, Optional
 
 from dependencies import APIKey, JwtAuthentication, get_api_key, get_db
+from extraction_executor import extraction_executor
 from fastapi import APIRouter, Depends, HTTPException, Request
 from helpers import check_timestamp, generate_and_save_summary
 from models import Summary
@@ -62,7 +63,7 @@ async def summarize(
     summarizer = Summarizer(
         texts=data.texts, lang=data.lang, summary_sentences_n=data.summary_sentences_n
     )
-    summary = summarizer.extract_summary()
+    summary = await extraction_executor.run(summarizer.extract_summary)
     return {"summary": summary}
 
 
@@ -81,11 +82,17 @@ async def summary(
             if check_timestamp(db, summary):
                 output = summary.text.split(" | ")
             else:
-                output = generate_and_save_summary(
-                    db, meeting_id, data.lang, summary_id=summary.id
+                output = await extraction_executor.run(
+                    generate_and_save_summary,
+                    db,
+                    meeting_id,
+                    data.lang,
+                    summary_id=summary.id,
                 )
         else:
-            output = generate_and_save_summary(db, meeting_id, data.lang)
+            output = await extraction_executor.run(
+                generate_and_save_summary, db, meeting_id, data.lang
+            )
         return {"summary": output}
     else:
         raise HTTPException(status_code=401, detail=("access denied"))
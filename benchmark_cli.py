@@ -0,0 +1,268 @@
+"""Performance benchmarks for the term extraction engine."""
+
+import re
+import time
+from argparse import ArgumentParser
+import numpy as np
+
+SAMPLE_SENTENCES = [
+    "Il panda gigante o panda maggiore è un mammifero appartenente alla famiglia degli orsi.",
+    "The giant panda or big panda is a mammal that belongs to the bear family.",
+    "Native to central China, it lives in the mountainous regions of Sichuan.",
+    "So yeah, welcome to my presentation on Agile product development.",
+    "Here I will discuss the framework of agile and how the technology team uses these practices.",
+    "Je vais parler de notre cadre de développement agile et comment notre équipe de technologie.",
+    "Proteins may be purified from other cellular components using a variety of techniques.",
+    "Las proteínas pueden purificarse a partir de otros componentes celulares.",
+    "tech team", "agile product development", "giant panda", "bear family",
+]
+
+
+def load_sentences(input_file, n):
+    """Read n sentences from a text file (one per line), or repeat the sample sentences."""
+    if input_file is not None:
+        with open(input_file, encoding="utf-8") as fh:
+            sentences = [line.strip() for line in fh if line.strip()]
+    else:
+        sentences = SAMPLE_SENTENCES
+    return [sentences[i % len(sentences)] for i in range(n)]
+
+
+def timed(func, *args, repeat=1, **kwargs):
+    """Return the result of func and its best wall-clock time in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def bench_encoder(args):
+    """Compare the throughput and the embeddings of the torch and onnx backends."""
+    from tm2tb.transformer_model import TransformerModel
+
+    sentences = load_sentences(args.input_file, args.n)
+    embeddings = {}
+    for backend in ("torch", "onnx"):
+        model = TransformerModel(args.model, backend=backend).load()
+        model.encode(sentences[:args.batch_size])
+        embeddings[backend], elapsed = timed(model.encode, sentences, batch_size=args.batch_size)
+        print(f"{backend}\t{len(sentences) / elapsed:.1f} sentences/s\t({elapsed:.3f}s)")
+
+    fp32, int8 = embeddings["torch"], embeddings["onnx"]
+    cosines = np.sum(fp32 * int8, axis=1) / (np.linalg.norm(fp32, axis=1) * np.linalg.norm(int8, axis=1))
+    print(f"cosine agreement\tmean {cosines.mean():.4f}\tmin {cosines.min():.4f}")
+
+
+def filter_stopwords_lists(spans, frequent_nouns, frequent_adjs):
+    """Stopword filter as it was before the lexicons became frozensets, for comparison."""
+    return [span for span in spans
+            if span.label_ != ''
+            or (span.lemma_.lower() not in frequent_nouns
+                and not set([tok.lemma_.lower() for tok in span]) & set(frequent_adjs))]
+
+
+def bench_stopwords(args):
+    """Compare stopword filtering with list lexicons and with frozenset lexicons."""
+    from tm2tb import TermExtractor
+
+    extractor = TermExtractor(load_sentences(args.input_file, 1), lang=args.lang)
+    docs = list(extractor.nlp.pipe(load_sentences(args.input_file, args.n)))
+    spans = [span for doc in docs for span in (doc[start:end] for _, start, end in extractor.matcher(doc))]
+    nouns, adjs = list(extractor.frequent_nouns), list(extractor.frequent_adjs)
+
+    kept_lists, lists_time = timed(filter_stopwords_lists, spans, nouns, adjs, repeat=args.repeat)
+    kept_sets, sets_time = timed(extractor._filter_stopwords, spans, repeat=args.repeat)
+    assert len(kept_lists) == len(kept_sets)
+    print(f"{len(spans)} candidates, {len(kept_sets)} kept")
+    print(f"lists\t{lists_time:.4f}s")
+    print(f"frozensets\t{sets_time:.4f}s\t({lists_time / sets_time:.1f}x)")
+
+
+def trim_spans_regex(spans, texts):
+    """Span trimming as it was before the interval sweep (regex search in the first text), for comparison."""
+    spans_indices = [[m.start(0) for m in re.finditer(span.text, texts[0])] for span in spans]
+    term_lens = [len(span.text) for span in spans]
+    longest_match_span = max(term_lens)
+    candidates = [m for i, m in enumerate(spans) if term_lens[i] < longest_match_span]
+    match_spans = set()
+    for i, matches in enumerate(spans_indices):
+        for idx in matches:
+            match_spans.add(tuple(range(idx, idx + term_lens[i])))
+    for cand in candidates:
+        idx = spans.index(cand)
+        cand_spans = [tuple(range(x, x + term_lens[idx])) for x in spans_indices[idx]]
+        for cand_span in cand_spans:
+            for match_span in match_spans - {cand_span}:
+                if all(x in match_span for x in cand_span):
+                    try:
+                        spans_indices[idx].remove(cand_span[0])
+                    except ValueError:
+                        pass
+    return [spans[i] for i in range(len(spans)) if len(spans_indices[i]) > 0]
+
+
+def bench_trim(args):
+    """Time span trimming on transcripts of increasing length."""
+    from tm2tb import TermExtractor
+
+    extractor = TermExtractor(load_sentences(args.input_file, 1), lang=args.lang)
+    print("sentences\tcandidates\toccurrences\tsweep_s\tregex_s")
+    for n in args.sizes:
+        transcript = " ".join(load_sentences(args.input_file, n))
+        docs = [(extractor.nlp(transcript), (0, 0, False))]
+        spans, spans_occurrences = extractor._collect_spans(docs)
+        n_occurrences = sum(len(spans_occurrences[span.text]) for span in spans)
+        _, sweep_time = timed(extractor._trim_spans, spans, spans_occurrences, repeat=args.repeat)
+        regex_time = "-"
+        if n <= args.regex_max:
+            _, elapsed = timed(trim_spans_regex, spans, [transcript])
+            regex_time = f"{elapsed:.4f}"
+        print(f"{n}\t{len(spans)}\t{n_occurrences}\t{sweep_time:.4f}\t{regex_time}")
+
+
+def clustered_embeddings(n, n_topics, dim=768, spread=.6, seed=0):
+    """Synthetic term embeddings scattered around n_topics random directions."""
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((n_topics, dim))
+    topics /= np.linalg.norm(topics, axis=1, keepdims=True)
+    noise = rng.standard_normal((n, dim)) * spread / np.sqrt(dim)
+    return (topics[rng.integers(n_topics, size=n)] + noise).astype(np.float32)
+
+
+def bench_cluster(args):
+    """Compare the latency of the clustering methods and their agreement with kmeans."""
+    from sklearn.metrics import adjusted_rand_score
+    from tm2tb.clustering import cluster_embeddings
+
+    print("terms\tmethod\tseconds\tclusters\tARI_vs_kmeans")
+    for n in args.sizes:
+        embeddings = clustered_embeddings(n, max(1, n // 10))
+        reference, _ = timed(cluster_embeddings, embeddings, "kmeans")
+        for method in args.methods:
+            labels, elapsed = timed(cluster_embeddings, embeddings, method, time_budget=args.time_budget / 1000,
+                                    repeat=args.repeat)
+            agreement = adjusted_rand_score(reference, labels)
+            print(f"{n}\t{method}\t{elapsed:.3f}\t{len(set(labels))}\t{agreement:.3f}")
+
+
+def synthetic_biterms(n, seed=0):
+    """Synthetic biterm columns, as assembled by BitermExtractor before the response is built."""
+    rng = np.random.default_rng(seed)
+    terms = np.array([f"term {i}" for i in range(n)], dtype=object)
+    return {"src_terms": terms,
+            "src_lemmas": terms,
+            "src_labels": np.full(n, "", dtype=object),
+            "src_frequencies": rng.integers(1, 10, size=n),
+            "src_clusters": rng.integers(0, max(1, n // 3), size=n).astype(np.int32),
+            "tgt_terms": terms,
+            "similarities": rng.uniform(.9, 1, size=n),
+            "frequencies": np.ones(n, dtype=int),
+            "ranks": rng.uniform(0, 1, size=n),
+            "origins": np.full(n, "similarity", dtype=object)}
+
+
+def bench_response(args):
+    """Compare the response construction time through a dataframe and straight from the columns."""
+    from tm2tb.biterm_extractor import BitermExtractor
+
+    def through_df(biterms):
+        return BitermExtractor._return_as_df(biterms).to_dict(orient="list")
+
+    print("biterms\tdataframe\tcolumns\tspeedup")
+    for n in args.sizes:
+        biterms = synthetic_biterms(n)
+        _, df_time = timed(through_df, biterms, repeat=args.repeat)
+        _, columns_time = timed(BitermExtractor._return_as_columns, biterms, repeat=args.repeat)
+        print(f"{n}\t{df_time * 1000:.3f}ms\t{columns_time * 1000:.3f}ms\t{df_time / columns_time:.1f}x")
+
+
+def bench_sides(args):
+    """
+    Compare the latency of biterm extraction with sequential and concurrent source and target sides,
+    for one request at a time and for concurrent requests, which share the side threads.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    import tm2tb.biterm_extractor as biterm_extractor
+
+    src_texts = load_sentences(args.src_file, args.n)
+    tgt_texts = load_sentences(args.tgt_file, args.n)
+    extractor = biterm_extractor.BitermExtractor(list(zip(src_texts, tgt_texts)),
+                                                 src_lang=args.src_lang, tgt_lang=args.tgt_lang)
+    extractor.extract_terms(as_columns=True)
+
+    def extract_concurrently():
+        with ThreadPoolExecutor(max_workers=args.concurrency) as requests:
+            for future in [requests.submit(extractor.extract_terms, as_columns=True)
+                           for _ in range(args.concurrency)]:
+                future.result()
+
+    print(f"side_threads\tseconds\tseconds_{args.concurrency}_requests")
+    for side_threads in (0, 2):
+        biterm_extractor.BITERM_SIDE_THREADS = side_threads
+        _, elapsed = timed(extractor.extract_terms, as_columns=True, repeat=args.repeat)
+        _, concurrent_elapsed = timed(extract_concurrently, repeat=args.repeat)
+        print(f"{side_threads}\t{elapsed:.3f}\t{concurrent_elapsed:.3f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser("Run tm2tb performance benchmarks.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    encoder_parser = subparsers.add_parser("encoder", help="torch vs quantized onnx encoder")
+    encoder_parser.add_argument("-m", "--model", dest="model", default="LaBSE", help="sentence transformer model")
+    encoder_parser.add_argument("-i", "--input", dest="input_file", default=None,
+                                help="text file with one sentence per line")
+    encoder_parser.add_argument("-n", type=int, dest="n", default=1000, help="number of sentences to encode")
+    encoder_parser.add_argument("-b", "--batch_size", type=int, dest="batch_size", default=32, help="batch size")
+    encoder_parser.set_defaults(func=bench_encoder)
+
+    stopwords_parser = subparsers.add_parser("stopwords", help="list vs frozenset stopword filtering")
+    stopwords_parser.add_argument("-l", "--lang", dest="lang", default="en", help="language of the sentences")
+    stopwords_parser.add_argument("-i", "--input", dest="input_file", default=None,
+                                  help="text file with one sentence per line")
+    stopwords_parser.add_argument("-n", type=int, dest="n", default=5000, help="number of sentences to parse")
+    stopwords_parser.add_argument("-r", "--repeat", type=int, dest="repeat", default=3, help="timing repetitions")
+    stopwords_parser.set_defaults(func=bench_stopwords)
+
+    trim_parser = subparsers.add_parser("trim", help="span trimming scaling with transcript length")
+    trim_parser.add_argument("-l", "--lang", dest="lang", default="en", help="language of the sentences")
+    trim_parser.add_argument("-i", "--input", dest="input_file", default=None,
+                             help="text file with one sentence per line")
+    trim_parser.add_argument("-s", "--sizes", type=int, nargs="+", dest="sizes",
+                             default=[500, 1000, 2000, 4000, 8000], help="transcript lengths in sentences")
+    trim_parser.add_argument("--regex-max", type=int, dest="regex_max", default=500,
+                             help="longest transcript also trimmed with the former regex implementation")
+    trim_parser.add_argument("-r", "--repeat", type=int, dest="repeat", default=3, help="timing repetitions")
+    trim_parser.set_defaults(func=bench_trim)
+
+    cluster_parser = subparsers.add_parser("cluster", help="latency and agreement of the clustering methods")
+    cluster_parser.add_argument("-s", "--sizes", type=int, nargs="+", dest="sizes",
+                                default=[100, 1000, 3000], help="numbers of terms")
+    cluster_parser.add_argument("-m", "--methods", nargs="+", dest="methods",
+                                default=["kmeans", "minibatch", "agglomerative", "leader"], help="methods to compare")
+    cluster_parser.add_argument("-t", "--time-budget", type=float, dest="time_budget", default=1000,
+                                help="time budget of the minibatch and leader methods, in milliseconds")
+    cluster_parser.add_argument("-r", "--repeat", type=int, dest="repeat", default=1, help="timing repetitions")
+    cluster_parser.set_defaults(func=bench_cluster)
+
+    response_parser = subparsers.add_parser("response", help="dataframe vs columns response construction")
+    response_parser.add_argument("-s", "--sizes", type=int, nargs="+", dest="sizes",
+                                 default=[10, 1000, 10000], help="numbers of biterms")
+    response_parser.add_argument("-r", "--repeat", type=int, dest="repeat", default=20, help="timing repetitions")
+    response_parser.set_defaults(func=bench_response)
+
+    sides_parser = subparsers.add_parser("sides", help="sequential vs concurrent source and target extraction")
+    sides_parser.add_argument("--src-lang", dest="src_lang", default="en", help="source language")
+    sides_parser.add_argument("--tgt-lang", dest="tgt_lang", default="en", help="target language")
+    sides_parser.add_argument("--src", dest="src_file", default=None, help="source text file, one sentence per line")
+    sides_parser.add_argument("--tgt", dest="tgt_file", default=None, help="target text file, one sentence per line")
+    sides_parser.add_argument("-n", type=int, dest="n", default=200, help="number of sentence pairs")
+    sides_parser.add_argument("-c", "--concurrency", type=int, dest="concurrency", default=4,
+                              help="number of concurrent requests")
+    sides_parser.add_argument("-r", "--repeat", type=int, dest="repeat", default=3, help="timing repetitions")
+    sides_parser.set_defaults(func=bench_sides)
+
+    args = parser.parse_args()
+    args.func(args)
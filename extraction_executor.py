@@ -0,0 +1,76 @@
+import asyncio
+import os
+import threading
+
+from fastapi import HTTPException
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+from tm2tb.extraction_pool import ExtractionPool
+from tm2tb.lazy_thread_pool import LazyThreadPool
+
+EXTRACTION_CONCURRENCY = int(os.environ.get("EXTRACTION_CONCURRENCY", 2))
+EXTRACTION_QUEUE_SIZE = int(os.environ.get("EXTRACTION_QUEUE_SIZE", 8))
+EXTRACTION_RETRY_AFTER = int(os.environ.get("EXTRACTION_RETRY_AFTER", 5))
+# "thread": extract in the API process; "process": dispatch to the extraction pool
+EXTRACTION_ENGINE = os.environ.get("EXTRACTION_ENGINE", "thread")
+
+
+class ExtractionExecutor:
+    """
+    Run CPU-bound extraction jobs (biterms, glossaries, summaries) in dedicated
+    threads, so that they do not block the asyncio event loop.
+
+    At most `concurrency` jobs run at the same time and at most `queue_size`
+    jobs wait for a thread. Further jobs are rejected with a 503 response and
+    a Retry-After header.
+    """
+
+    def __init__(self, concurrency, queue_size, retry_after):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self.pending = 0
+        self.rejected = 0
+        self._threads = LazyThreadPool(concurrency, thread_name_prefix="extraction")
+        self._lock = threading.Lock()
+
+    def _release(self, _):
+        with self._lock:
+            self.pending -= 1
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) in an extraction thread and await its result.
+
+        Raises:
+            HTTPException: 503 if the wait queue is full.
+        """
+        with self._lock:
+            if self.pending >= self.concurrency + self.queue_size:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many extraction requests, please retry later.",
+                    headers={"Retry-After": str(self.retry_after)},
+                )
+            self.pending += 1
+        future = self._threads.submit(func, *args, **kwargs)
+        # Release the slot when the job finishes, even if the request is cancelled.
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "concurrency": self.concurrency,
+                "queue_size": self.queue_size,
+                "running": min(self.pending, self.concurrency),
+                "queued": max(self.pending - self.concurrency, 0),
+                "rejected": self.rejected,
+            }
+
+
+extraction_executor = ExtractionExecutor(
+    EXTRACTION_CONCURRENCY, EXTRACTION_QUEUE_SIZE, EXTRACTION_RETRY_AFTER
+)
+
+extraction_pool = ExtractionPool() if EXTRACTION_ENGINE == "process" else None
@@ -2,9 +2,12 @@ import os
 
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
+from starlette.status import HTTP_502_BAD_GATEWAY, HTTP_504_GATEWAY_TIMEOUT
 
+from extraction_executor import extraction_pool
 from models import Summary, Transcript
-from tm2tb import BitermExtractor, Summarizer
+from tm2tb import BitermExtractor, Summarizer, extraction_pool as pool_tasks
+from tm2tb.extraction_pool import WorkerCrashedError
 
 SUMMARY_THRESHOLD = os.environ.get("SUMMARY_THRESHOLD")
 
@@ -25,13 +28,35 @@ def transcript_data(db: Session, meeting_id, lang):
         return False
 
 
+def extract_biterms(bitext_data, src_lang, tgt_lang, **kwargs):
+    """
+    Extract biterms in this process, or in the extraction pool if EXTRACTION_ENGINE is "process".
+
+    Raises:
+        HTTPException: 504 if the extraction pool task times out,
+            502 if its worker process dies.
+    """
+    if extraction_pool is None:
+        extractor = BitermExtractor(bitext_data, src_lang=src_lang, tgt_lang=tgt_lang)
+        return extractor.extract_terms(**kwargs)
+    try:
+        return extraction_pool.run(
+            pool_tasks.extract_biterms, bitext_data, src_lang, tgt_lang, kwargs
+        )
+    except TimeoutError as e:
+        raise HTTPException(status_code=HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
+    except WorkerCrashedError as e:
+        raise HTTPException(status_code=HTTP_502_BAD_GATEWAY, detail=str(e))
+
+
 def extract_glossary(source_transcript, target_transcript, src_lang, tgt_lang):
     try:
         bitext_data = list(zip(source_transcript, target_transcript))
 
-        extractor = BitermExtractor(bitext_data, src_lang=src_lang, tgt_lang=tgt_lang)
-
-        biterms = extractor.extract_terms(
+        biterms = extract_biterms(
+            bitext_data,
+            src_lang,
+            tgt_lang,
             freq_min=1,
             span_range=(1, 7),
             filter_stopwords=True,
@@ -40,9 +65,10 @@ def extract_glossary(source_transcript, target_transcript, src_lang, tgt_lang):
             collapse_lemmas=True,
             return_unmatched_terms=True,
             mt_unmatched_terms=True,
+            as_columns=True,
         )
 
-        return biterms.to_dict(orient="list")
+        return biterms
     except ValueError as e:
         if str(e) == "No terms found." or str(e) == "No biterms found.":
             biterms_dict = {
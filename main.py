@@ -4,6 +4,9 @@ from fastapi_versioning import VersionedFastAPI, version
 from api.v1_0 import glossary_view, summary_view, transcript_view
 from database import Base, engine
 from dependencies import APIKey, get_api_key
+from extraction_executor import extraction_executor, extraction_pool
+from tm2tb import spacy_registry, startup_timings, trf_model
+from tm2tb.encoding_scheduler import EncodingScheduler
 
 Base.metadata.create_all(bind=engine)
 
@@ -39,6 +42,21 @@ async def info(api_key: APIKey = Depends(get_api_key)):
     ]
 
 
+@app.get("/metrics")
+@version(1, 0)
+async def metrics(api_key: APIKey = Depends(get_api_key)):
+    return {
+        "extraction_executor": extraction_executor.stats(),
+        "extraction_pool": extraction_pool.stats() if extraction_pool else None,
+        "embedding_cache": trf_model.cache.stats(),
+        "encoding_scheduler": trf_model.model.stats()
+        if isinstance(trf_model.model, EncodingScheduler)
+        else None,
+        "spacy_models": spacy_registry.stats(),
+        "startup_timings": startup_timings(),
+    }
+
+
 app = VersionedFastAPI(
     app, version_format="{major}_{minor}", prefix_format="/api/v{major}_{minor}"
 )
@@ -0,0 +1,47 @@
+"""Report the memory of the server workers: RSS, PSS and USS per process (Linux only)."""
+
+import os
+from argparse import ArgumentParser
+
+
+def memory_usage(pid):
+    """
+    Read the memory counters of a process from /proc/<pid>/smaps_rollup.
+
+    PSS divides each shared page among the processes that map it, and USS counts
+    only the pages private to the process, i.e. the memory freed if it exits.
+    """
+    counters = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as fh:
+        for line in fh:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                counters[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss_mb": counters["Rss"] / 1024,
+        "pss_mb": counters["Pss"] / 1024,
+        "uss_mb": (counters["Private_Clean"] + counters["Private_Dirty"]) / 1024,
+    }
+
+
+def child_pids(pid):
+    pids = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children", encoding="utf-8") as fh:
+            pids.extend(int(child) for child in fh.read().split())
+    return pids
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser("Report PSS/USS of the server master and its workers.")
+    parser.add_argument(dest="pid", type=int, help="pid of the server master process")
+    args = parser.parse_args()
+
+    print("pid\trole\trss_mb\tpss_mb\tuss_mb")
+    totals = {"rss_mb": 0, "pss_mb": 0, "uss_mb": 0}
+    for role, pid in [("master", args.pid)] + [("worker", child) for child in child_pids(args.pid)]:
+        usage = memory_usage(pid)
+        for key in totals:
+            totals[key] += usage[key]
+        print(f"{pid}\t{role}\t{usage['rss_mb']:.1f}\t{usage['pss_mb']:.1f}\t{usage['uss_mb']:.1f}")
+    print(f"total\t\t{totals['rss_mb']:.1f}\t{totals['pss_mb']:.1f}\t{totals['uss_mb']:.1f}")
@@ -0,0 +1,125 @@
+"""
+Preload-then-fork server.
+
+The master process loads the sentence transformer model and the spaCy models,
+imports the app, and then forks the uvicorn workers. The workers share the
+model weights copy-on-write instead of holding one copy each.
+
+Usage: python server.py --host 0.0.0.0 --port 8000 --workers 4
+"""
+
+import gc
+import os
+import signal
+import socket
+import sys
+from argparse import ArgumentParser
+
+import uvicorn
+
+
+def preload_models(langs):
+    """Load the models in the master process, ready to be shared by the workers."""
+    from tm2tb import log_startup_timings, preload_language_resources, spacy_registry, trf_model
+
+    freeze_model(trf_model.model.preload())
+    spacy_registry.preload(langs)
+    preload_language_resources(langs)
+    log_startup_timings()
+
+
+def freeze_model(model):
+    """
+    Put a torch model in eval mode with gradients disabled.
+
+    Inference then never writes to the weight tensors, so their pages stay
+    shared between the workers. No inference is run in the master: it would
+    start the torch thread pools, which do not survive a fork.
+    """
+    if hasattr(model, "parameters"):
+        model.eval()
+        for param in model.parameters():
+            param.requires_grad_(False)
+
+
+def run_worker(app, sock, args):
+    """Serve the app on the inherited socket (runs in a forked worker)."""
+    if args.torch_threads:
+        import torch
+
+        torch.set_num_threads(args.torch_threads)
+    config = uvicorn.Config(app, timeout_keep_alive=args.timeout_keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn_worker(app, sock, args):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(app, sock, args)
+        finally:
+            os._exit(0)
+    return pid
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser("Serve the API from workers forked after loading the models.")
+    parser.add_argument("--host", dest="host", default="0.0.0.0", help="bind host")
+    parser.add_argument("--port", type=int, dest="port", default=8000, help="bind port")
+    parser.add_argument("-w", "--workers", type=int, dest="workers",
+                        default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+                        help="number of worker processes (default: WEB_CONCURRENCY or the number of CPUs)")
+    parser.add_argument("-l", "--langs", dest="langs", default="en,de,es,fr,it,pt",
+                        help="comma-separated languages whose spaCy models are preloaded")
+    parser.add_argument("--torch-threads", type=int, dest="torch_threads", default=0,
+                        help="torch intra-op threads per worker (default: torch's own default)")
+    parser.add_argument("--timeout-keep-alive", type=int, dest="timeout_keep_alive", default=600,
+                        help="keep-alive timeout in seconds")
+    args = parser.parse_args()
+    # Read by the extraction pool of each worker, to share the CPUs of the host between them
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+
+    preload_models([lang for lang in args.langs.split(",") if lang])
+
+    from database import engine
+    from main import app
+
+    # Connections opened by the master must not be shared with the workers
+    engine.dispose()
+    # Keep the garbage collector from touching (and copying) the preloaded objects
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    workers = {spawn_worker(app, sock, args) for _ in range(args.workers)}
+    print(f"Master {os.getpid()} serving on {args.host}:{args.port} with workers {sorted(workers)}")
+
+    stopping = False
+
+    def stop(signum, frame):
+        global stopping
+        stopping = True
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Replace workers that die, until the master is asked to stop
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}, restarting it")
+            workers.add(spawn_worker(app, sock, args))
+    sys.exit(0)
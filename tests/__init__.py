@@ -2,3 +2,17 @@ from . import test_summary
 from . import test_glossary
 from . import test_main
 from . import test_summarization
+from . import test_embedding_cache
+from . import test_embedding_store
+from . import test_extraction_executor
+from . import test_extraction_pool
+from . import test_encoding_scheduler
+from . import test_encoding
+from . import test_term_extractor
+from . import test_clustering
+from . import test_similarity
+from . import test_biterm_extractor
+from . import test_doc_chunks
+from . import test_transformer_model
+from . import test_spacy_models
+from . import test_onnx_model
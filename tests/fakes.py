@@ -0,0 +1,14 @@
+"""
+Fake models shared by the unit tests.
+"""
+import numpy as np
+
+
+class CountingModel:
+    """Fake sentence-transformer model that records the batches of texts it encodes."""
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, sentences, **kwargs):
+        self.encoded.append(list(sentences))
+        return np.array([[len(text), 1.0] for text in sentences], dtype=np.float32)
@@ -0,0 +1,136 @@
+"""
+Biterm extractor unit tests.
+"""
+import threading
+
+import numpy as np
+import pytest
+from threadpoolctl import ThreadpoolController
+from tm2tb import biterm_extractor
+from tm2tb.biterm_extractor import BitermExtractor, _run_sides
+
+
+def test_prune_biterms_keeps_best_source_of_each_target():
+    """
+    GIVEN two source terms whose best match is the same target term,
+    WHEN the biterms are pruned,
+    THEN only the most similar source term is kept for that target term,
+    AND the biterms are ordered by target term.
+    """
+    src_texts = np.array(["giant panda", "panda", "bear family"], dtype=object)
+    tgt_texts = np.array(["panda gigante", "famiglia degli orsi"], dtype=object)
+    src_idx, tgt_idx, similarities = BitermExtractor._prune_biterms(
+        src_texts, tgt_texts, np.array([0, 0, 1]), np.array([0.95, 0.91, 0.93]), 0.9)
+    assert src_idx.tolist() == [2, 0]
+    assert tgt_idx.tolist() == [1, 0]
+    assert similarities.tolist() == [0.93, 0.95]
+
+
+def test_prune_biterms_without_similar_terms():
+    """
+    GIVEN biterms below the minimum similarity,
+    WHEN the biterms are pruned,
+    THEN a ValueError is raised.
+    """
+    with pytest.raises(ValueError, match="No biterms found."):
+        BitermExtractor._prune_biterms(np.array(["panda"], dtype=object), np.array(["orso"], dtype=object),
+                                       np.array([0]), np.array([0.5]), 0.9)
+
+
+def test_collapse_biterm_lemmas_keeps_best_ranked_lemma():
+    """
+    GIVEN two biterms whose source terms share a lower-cased lemma, and an entity,
+    WHEN the biterms are collapsed by lemma,
+    THEN the best ranked biterm of the lemma and the entity are kept, sorted by rank.
+    """
+    biterms = {"src_terms": np.array(["Pandas", "panda", "China"], dtype=object),
+               "src_lemmas": np.array(["Panda", "panda", "China"], dtype=object),
+               "src_labels": np.array(["", "", "GPE"], dtype=object),
+               "ranks": np.array([0.2, 0.5, 0.1])}
+    collapsed = BitermExtractor._collapse_biterm_lemmas(biterms)
+    assert collapsed["src_terms"].tolist() == ["panda", "China"]
+
+
+def test_return_as_columns_sorts_and_rounds():
+    """
+    GIVEN biterm columns with unrounded similarities and ranks,
+    WHEN they are returned as columns,
+    THEN the response columns are plain lists sorted by rank, rounded to 3 decimals,
+    AND biterms with the same rank keep their order.
+    """
+    biterms = {"src_terms": np.array(["panda", "bear", "China"], dtype=object),
+               "src_lemmas": np.array(["panda", "bear", "China"], dtype=object),
+               "src_labels": np.array(["", "", "GPE"], dtype=object),
+               "src_frequencies": np.array([2, 1, 1]),
+               "src_clusters": np.array([0, 1, 0], dtype=np.int32),
+               "tgt_terms": np.array(["panda", "", "Cina"], dtype=object),
+               "similarities": np.array([0.95123, 0.0, 0.98765]),
+               "frequencies": np.array([1, 0, 1]),
+               "ranks": np.array([0.0001, 0.0, 0.45678]),
+               "origins": np.array(["similarity", "", "similarity"], dtype=object)}
+    columns = BitermExtractor._return_as_columns(biterms)
+    assert "src_lemmas" not in columns
+    assert columns["src_terms"] == ["China", "panda", "bear"]
+    assert columns["similarities"] == [0.988, 0.951, 0.0]
+    assert columns["ranks"] == [0.457, 0.0, 0.0]
+    assert type(columns["src_clusters"][0]) is int
+
+
+def test_run_sides_returns_source_then_target():
+    """
+    GIVEN a source stage and a target stage,
+    WHEN they are run as the two sides of an extraction,
+    THEN their results are returned in source, target order.
+    """
+    assert _run_sides(lambda: "src", lambda: "tgt") == ("src", "tgt")
+
+
+def test_run_sides_raises_source_error_first():
+    """
+    GIVEN a source stage and a target stage that both fail,
+    WHEN they are run as the two sides of an extraction,
+    THEN the error of the source stage is raised, as if they had run one after the other.
+    """
+    def fail(side):
+        raise ValueError(f"No terms found in {side}.")
+
+    with pytest.raises(ValueError, match="source"):
+        _run_sides(lambda: fail("source"), lambda: fail("target"))
+
+
+def test_run_sides_inline_when_side_threads_are_busy(monkeypatch):
+    """
+    GIVEN side threads that are all busy with other extractions,
+    WHEN the two sides of an extraction are run,
+    THEN both run in the calling thread instead of waiting for a side thread.
+    """
+    monkeypatch.setattr(biterm_extractor, "_side_threads", biterm_extractor.LazyThreadPool(1, "test-side"))
+    release = threading.Event()
+    busy = biterm_extractor._side_threads.try_submit(release.wait)
+    try:
+        sides = _run_sides(threading.current_thread, threading.current_thread)
+    finally:
+        release.set()
+    assert busy.result()
+    assert sides == (threading.current_thread(), threading.current_thread())
+
+
+def test_run_sides_limits_openmp_threads_of_both_sides(monkeypatch):
+    """
+    GIVEN a limit of 3 OpenMP threads per side,
+    WHEN the two sides of an extraction run concurrently,
+    THEN both the source and the target stage see the limit,
+    AND the calling thread gets its own limit back afterwards.
+    """
+    controller = ThreadpoolController().select(user_api="openmp")
+    if len(controller.lib_controllers) == 0:
+        pytest.skip("No OpenMP library loaded.")
+
+    def omp_threads():
+        return [lib.num_threads for lib in ThreadpoolController().select(user_api="openmp").lib_controllers]
+
+    monkeypatch.setattr(biterm_extractor, "BITERM_SIDE_OMP_THREADS", 3)
+    before = omp_threads()
+    src_threads, tgt_threads = _run_sides(omp_threads, omp_threads)
+    assert set(src_threads) == set(tgt_threads) == {3}
+    assert omp_threads() == before
@@ -0,0 +1,66 @@
+"""
+Term clustering unit tests.
+"""
+import numpy as np
+import pytest
+from tm2tb import clustering
+from tm2tb.clustering import cluster_embeddings
+
+EMBEDDINGS = np.array([[1, 0, 0], [0.99, 0.1, 0], [0, 1, 0], [0, 0.98, 0.1], [0, 0, 1]], dtype=np.float32)
+
+
+@pytest.mark.parametrize("method", ["kmeans", "minibatch", "agglomerative", "leader"])
+def test_single_term_is_clustered(method):
+    """
+    GIVEN a single term,
+    WHEN it is clustered,
+    THEN it gets the cluster 0 instead of failing with 0 clusters.
+    """
+    assert cluster_embeddings(EMBEDDINGS[:1], method=method).tolist() == [0]
+
+
+@pytest.mark.parametrize("method", ["agglomerative", "leader"])
+def test_similar_terms_share_a_cluster(method):
+    """
+    GIVEN pairs of nearly identical embeddings,
+    WHEN they are clustered with a similarity threshold,
+    THEN each pair shares a cluster and the last term is alone.
+    """
+    labels = cluster_embeddings(EMBEDDINGS, method=method)
+    assert labels[0] == labels[1]
+    assert labels[2] == labels[3]
+    assert len(set(labels.tolist())) == 3
+
+
+def test_clustering_can_be_skipped():
+    """
+    GIVEN term embeddings,
+    WHEN the cluster method is None,
+    THEN every term gets the cluster -1.
+    """
+    assert cluster_embeddings(EMBEDDINGS, method=None).tolist() == [-1] * 5
+
+
+
+def test_auto_method_switches_to_minibatch_above_its_maximum(monkeypatch):
+    """
+    GIVEN the auto method limited to 4 terms with kmeans,
+    WHEN 4 and then 5 terms are clustered,
+    THEN kmeans clusters the 4 terms and minibatch the 5 terms,
+    AND kmeans stays exact above the limit.
+    """
+    used = []
+
+    def recorder(method):
+        def cluster(embeddings, time_budget):
+            used.append(method)
+            return np.zeros(len(embeddings), dtype=np.int32)
+        return cluster
+
+    monkeypatch.setattr(clustering, "CLUSTER_KMEANS_MAX_TERMS", 4)
+    monkeypatch.setitem(clustering._methods, "kmeans", recorder("kmeans"))
+    monkeypatch.setitem(clustering._methods, "minibatch", recorder("minibatch"))
+    cluster_embeddings(EMBEDDINGS[:4], method="auto")
+    cluster_embeddings(EMBEDDINGS, method="auto")
+    cluster_embeddings(EMBEDDINGS, method="kmeans")
+    assert used == ["kmeans", "minibatch", "kmeans"]
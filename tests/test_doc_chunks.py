@@ -0,0 +1,55 @@
+"""
+Doc chunks unit tests.
+"""
+import spacy
+from tm2tb.doc_chunks import sentence_chunks, sample_chunks
+
+nlp = spacy.blank("en")
+
+
+def test_sentence_chunks_group_whole_sentences():
+    """
+    GIVEN a doc of three short sentences,
+    WHEN it is cut into chunks of up to 9 tokens,
+    THEN the chunks hold whole sentences,
+    AND their weights are their numbers of tokens.
+    """
+    doc = nlp("The giant panda is a mammal. It lives in China. It eats bamboo.")
+    chunks = sentence_chunks(doc, chunk_tokens=9)
+    assert chunks == [("The giant panda is a mammal.", 7), ("It lives in China. It eats bamboo.", 9)]
+
+
+def test_sentence_chunks_cut_long_sentences_in_windows():
+    """
+    GIVEN a doc of a single sentence without punctuation,
+    WHEN it is cut into chunks of up to 4 tokens,
+    THEN the sentence is cut in windows of 4 tokens.
+    """
+    doc = nlp("so yeah welcome to my presentation on agile product development")
+    chunks = sentence_chunks(doc, chunk_tokens=4)
+    assert chunks == [("so yeah welcome to", 4), ("my presentation on agile", 4), ("product development", 2)]
+
+
+def test_sample_chunks_of_long_docs():
+    """
+    GIVEN more chunks than allowed,
+    WHEN they are sampled,
+    THEN evenly spaced chunks are kept, including the first and the last,
+    AND their weights are their shares of the tokens of the doc.
+    """
+    chunks = [(0, f"Sentence number {i}.", 4) for i in range(10)]
+    texts, weights = sample_chunks(chunks, chunks_max=4)
+    assert texts == ["Sentence number 0.", "Sentence number 3.", "Sentence number 6.", "Sentence number 9."]
+    assert weights.tolist() == [.1, .1, .1, .1]
+
+
+def test_sample_chunks_weigh_docs_equally():
+    """
+    GIVEN a short doc encoded whole and a long doc cut in two chunks,
+    WHEN the chunks are weighted,
+    THEN both docs weigh the same, and the chunks of the long doc weigh their share of its tokens.
+    """
+    chunks = [(0, "The giant panda is a mammal.", 7), (1, "It lives in China.", 5), (1, "It eats bamboo.", 4)]
+    texts, weights = sample_chunks(chunks)
+    assert texts == ["The giant panda is a mammal.", "It lives in China.", "It eats bamboo."]
+    assert weights.tolist() == [1, 5 / 9, 4 / 9]
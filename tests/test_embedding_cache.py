@@ -0,0 +1,52 @@
+"""
+Embedding cache unit tests.
+"""
+import numpy as np
+from tm2tb.embedding_cache import CachedEncoder, EmbeddingCache
+from .fakes import CountingModel
+
+
+def test_only_misses_are_encoded():
+    """
+    GIVEN a cached encoder,
+    WHEN the same texts are encoded twice,
+    THEN only the new texts reach the model, once each, and the order is kept.
+    """
+    model = CountingModel()
+    encoder = CachedEncoder(model, "fake")
+    first = encoder.encode(["tech team", "agile", "tech team"])
+    second = encoder.encode(["agile", "product", "tech team"])
+    assert model.encoded == [["tech team", "agile"], ["product"]]
+    assert first[:, 0].tolist() == [9, 5, 9]
+    assert second[:, 0].tolist() == [5, 7, 9]
+    assert encoder.cache.stats()["hits"] == 2
+
+
+def test_lru_eviction_by_entries():
+    """
+    GIVEN a cache limited to two entries,
+    WHEN a third entry is added,
+    THEN the least recently used entry is evicted.
+    """
+    cache = EmbeddingCache(max_entries=2)
+    cache.put(("m", "a"), np.zeros(2))
+    cache.put(("m", "b"), np.zeros(2))
+    cache.get(("m", "a"))
+    cache.put(("m", "c"), np.zeros(2))
+    assert cache.get(("m", "b")) is None
+    assert cache.get(("m", "a")) is not None
+    assert cache.evictions == 1
+
+
+def test_lru_eviction_by_bytes():
+    """
+    GIVEN a cache with a small byte budget,
+    WHEN entries exceeding the budget are added,
+    THEN the total size stays within the budget.
+    """
+    embedding = np.zeros(100, dtype=np.float32)
+    cache = EmbeddingCache(max_entries=100, max_bytes=3 * embedding.nbytes + 200)
+    for text in "abcde":
+        cache.put(("m", text), embedding)
+    assert len(cache) == 3
+    assert cache.nbytes <= cache.max_bytes
@@ -0,0 +1,68 @@
+"""
+Embedding store unit tests.
+"""
+import numpy as np
+from tm2tb.embedding_cache import CachedEncoder
+from tm2tb.embedding_store import EmbeddingStore
+from .fakes import CountingModel
+
+
+def test_store_is_shared_across_instances(tmp_path):
+    """
+    GIVEN an embedding store with some rows,
+    WHEN a second store is opened on the same directory (e.g. after a restart),
+    THEN it sees the rows and appends after them.
+    """
+    store = EmbeddingStore(str(tmp_path), "fake")
+    store.put_many(["tech team", "agile"], np.array([[1, 2], [3, 4]], dtype=np.float32))
+    other = EmbeddingStore(str(tmp_path), "fake")
+    assert other.get_many(["agile", "product"])[0].tolist() == [3, 4]
+    assert other.get_many(["product"]) == [None]
+    other.put_many(["product", "agile"], np.array([[5, 6], [7, 8]], dtype=np.float32))
+    assert len(other) == 3
+    assert store.get_many(["product", "tech team"])[0].tolist() == [5, 6]
+
+
+def test_encoder_checks_store_before_model(tmp_path):
+    """
+    GIVEN two cached encoders sharing an embedding store,
+    WHEN the second one encodes terms already encoded by the first one,
+    THEN the model is not called again.
+    """
+    first_model, second_model = CountingModel(), CountingModel()
+    CachedEncoder(first_model, "fake", store=EmbeddingStore(str(tmp_path), "fake")).encode(["tech team"], persist=True)
+    encoder = CachedEncoder(second_model, "fake", store=EmbeddingStore(str(tmp_path), "fake", dtype="float32"))
+    embeddings = encoder.encode(["tech team", "agile"], persist=True)
+    assert second_model.encoded == [["agile"]]
+    assert embeddings[:, 0].tolist() == [9, 5]
+
+
+def test_only_persisted_texts_are_stored(tmp_path):
+    """
+    GIVEN a cached encoder with an embedding store,
+    WHEN it encodes a document and a term, persisting only the term,
+    THEN only the term is written to the store.
+    """
+    store = EmbeddingStore(str(tmp_path), "fake")
+    encoder = CachedEncoder(CountingModel(), "fake", store=store)
+    encoder.encode(["the tech team met on monday", "tech team"], persist=[False, True])
+    encoder.encode(["another meeting"])
+    assert len(store) == 1
+    assert store.get_many(["tech team"])[0].tolist() == [9, 1]
+
+
+def test_store_rotates_when_full(tmp_path):
+    """
+    GIVEN an embedding store limited to 4 rows (2 generations of 2 rows),
+    WHEN 6 texts are stored, 2 at a time,
+    THEN only the 4 most recent texts are kept,
+    AND the vectors file of the oldest generation is deleted.
+    """
+    store = EmbeddingStore(str(tmp_path), "fake", max_rows=4)
+    for i in range(3):
+        store.put_many([f"term {2 * i}", f"term {2 * i + 1}"],
+                       np.array([[2 * i, 0], [2 * i + 1, 0]], dtype=np.float32))
+    assert len(store) == 4
+    assert store.get_many(["term 0", "term 1"]) == [None, None]
+    assert [embedding[0] for embedding in store.get_many(["term 2", "term 5"])] == [2, 5]
+    assert sorted(path.name for path in tmp_path.glob("*.vectors")) == ["fake.1.vectors", "fake.2.vectors"]
@@ -0,0 +1,45 @@
+"""
+Batched encoding unit tests.
+"""
+from tm2tb import encoding
+from tm2tb.embedding_cache import CachedEncoder
+from tm2tb.embedding_store import EmbeddingStore
+from .fakes import CountingModel
+
+
+def test_duplicates_are_encoded_once(monkeypatch):
+    """
+    GIVEN texts with duplicates,
+    WHEN they are encoded,
+    THEN each distinct text is encoded once, in a single batch sorted by length,
+    AND the embeddings are returned in the input order.
+    """
+    model = CountingModel()
+    monkeypatch.setattr(encoding, "trf_model", model)
+    embeddings = encoding.encode_texts(["tech team", "agile", "tech team", "a"])
+    assert model.encoded == [["a", "agile", "tech team"]]
+    assert embeddings[:, 0].tolist() == [9, 5, 9, 1]
+
+
+def test_empty_input(monkeypatch):
+    """
+    GIVEN no texts,
+    WHEN they are encoded,
+    THEN no embedding is returned.
+    """
+    monkeypatch.setattr(encoding, "trf_model", CountingModel())
+    assert len(encoding.encode_texts([])) == 0
+
+
+def test_persist_flags_follow_the_texts(monkeypatch, tmp_path):
+    """
+    GIVEN a document and terms, one of them repeated,
+    WHEN they are encoded with the terms marked as persistent,
+    THEN only the terms are written to the embedding store.
+    """
+    store = EmbeddingStore(str(tmp_path), "fake")
+    monkeypatch.setattr(encoding, "trf_model", CachedEncoder(CountingModel(), "fake", store=store))
+    encoding.encode_texts(["the agile tech team", "tech team", "agile", "tech team"],
+                          persist=[False, True, True, True])
+    assert len(store) == 2
+    assert store.get_many(["the agile tech team"]) == [None]
@@ -0,0 +1,108 @@
+"""
+Encoding scheduler unit tests.
+"""
+import os
+import threading
+
+import pytest
+from tm2tb.encoding_scheduler import EncodingScheduler
+from .fakes import CountingModel
+
+
+def test_concurrent_calls_share_a_batch():
+    """
+    GIVEN an encoding scheduler with a generous wait deadline,
+    WHEN four threads encode their texts at the same time,
+    THEN the model encodes fewer batches than calls,
+    AND each thread gets the embeddings of its own texts.
+    """
+    model = CountingModel()
+    scheduler = EncodingScheduler(model, max_batch_size=100, max_wait_ms=200)
+    texts = [["a" * (i + 1), "b" * (i + 5)] for i in range(4)]
+    results = [None] * 4
+    barrier = threading.Barrier(4)
+
+    def worker(i):
+        barrier.wait()
+        results[i] = scheduler.encode(texts[i])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(model.encoded) < 4
+    for i in range(4):
+        assert results[i][:, 0].tolist() == [i + 1, i + 5]
+    assert scheduler.stats()["calls"] == 4
+
+
+def test_batch_is_flushed_when_full():
+    """
+    GIVEN an encoding scheduler with a batch size of 2,
+    WHEN a single call encodes 2 texts,
+    THEN it is flushed without waiting for the deadline.
+    """
+    model = CountingModel()
+    scheduler = EncodingScheduler(model, max_batch_size=2, max_wait_ms=60000)
+    assert scheduler.encode(["ab", "abc"])[:, 0].tolist() == [2, 3]
+
+
+def test_single_sentence():
+    """
+    GIVEN an encoding scheduler,
+    WHEN a single string is encoded,
+    THEN a single embedding is returned, as with the wrapped model.
+    """
+    scheduler = EncodingScheduler(CountingModel(), max_batch_size=8, max_wait_ms=1)
+    assert scheduler.encode("abcd").tolist() == [4, 1]
+
+
+class ExitingModel(CountingModel):
+    """Fake model whose first batch raises SystemExit."""
+    def encode(self, sentences, **kwargs):
+        if not self.encoded:
+            self.encoded.append(list(sentences))
+            raise SystemExit("model exited")
+        return super().encode(sentences, **kwargs)
+
+
+def test_base_exception_is_returned_to_the_caller():
+    """
+    GIVEN an encoding scheduler whose model raises SystemExit on its first batch,
+    WHEN two calls are encoded one after the other,
+    THEN the first call raises the SystemExit instead of waiting forever,
+    AND the second call is encoded.
+    """
+    scheduler = EncodingScheduler(ExitingModel(), max_batch_size=8, max_wait_ms=1)
+    with pytest.raises(SystemExit):
+        scheduler.encode(["ab"])
+    assert scheduler.encode(["abc"])[:, 0].tolist() == [3]
+
+
+def test_concurrent_calls_after_fork():
+    """
+    GIVEN an encoding scheduler already used by the parent process,
+    WHEN a forked child encodes from four threads at the same time,
+    THEN every call of the child gets its embeddings.
+    """
+    scheduler = EncodingScheduler(CountingModel(), max_batch_size=100, max_wait_ms=20)
+    scheduler.encode(["parent"])
+    pid = os.fork()
+    if pid == 0:
+        results = []
+        barrier = threading.Barrier(4)
+
+        def worker(i):
+            barrier.wait()
+            results.append(scheduler.encode(["a" * (i + 1)])[0, 0])
+
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+        os._exit(0 if sorted(results) == [1, 2, 3, 4] else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,51 @@
+"""
+Extraction executor unit tests.
+"""
+import asyncio
+import threading
+
+import pytest
+from extraction_executor import ExtractionExecutor
+from fastapi import HTTPException
+
+
+def test_rejects_when_queue_is_full():
+    """
+    GIVEN an executor with one thread and a wait queue of one job,
+    WHEN a third job is submitted while the first two are pending,
+    THEN it is rejected with a 503 and a Retry-After header,
+    AND the pending jobs still complete.
+    """
+    executor = ExtractionExecutor(concurrency=1, queue_size=1, retry_after=7)
+    release = threading.Event()
+
+    async def submit_jobs():
+        first = asyncio.ensure_future(executor.run(release.wait))
+        second = asyncio.ensure_future(executor.run(lambda: "done"))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as error:
+            await executor.run(lambda: "rejected")
+        release.set()
+        return error.value, await first, await second
+
+    error, first, second = asyncio.run(submit_jobs())
+    assert error.status_code == 503
+    assert error.headers == {"Retry-After": "7"}
+    assert (first, second) == (True, "done")
+    assert executor.stats()["rejected"] == 1
+
+
+def test_propagates_job_errors():
+    """
+    GIVEN an executor,
+    WHEN a job raises a ValueError,
+    THEN the error is raised to the caller and the slot is released.
+    """
+    executor = ExtractionExecutor(concurrency=1, queue_size=0, retry_after=1)
+
+    def no_terms():
+        raise ValueError("No terms found.")
+
+    with pytest.raises(ValueError):
+        asyncio.run(executor.run(no_terms))
+    assert asyncio.run(executor.run(lambda: 42)) == 42
@@ -0,0 +1,96 @@
+"""
+Extraction pool unit tests.
+"""
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+import tm2tb
+from tm2tb.extraction_pool import ExtractionPool, WorkerCrashedError, default_pool_size
+
+# Models loaded by the worker initializer, recorded in the worker process
+preloaded = []
+
+
+def worker_pid():
+    return os.getpid()
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def crash():
+    os._exit(1)
+
+
+def preloaded_models():
+    return preloaded
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """A single forked worker, whose initializer records the models instead of loading them."""
+    monkeypatch.setattr(tm2tb, "trf_model", SimpleNamespace(model=SimpleNamespace(
+        preload=lambda: preloaded.append("LaBSE"))))
+    monkeypatch.setattr(tm2tb, "spacy_registry", SimpleNamespace(
+        preload=lambda langs: preloaded.extend(f"spacy_{lang}" for lang in langs)))
+    monkeypatch.setattr(tm2tb, "preload_language_resources", lambda langs: None)
+    monkeypatch.setattr(tm2tb, "log_startup_timings", lambda: None)
+    extraction_pool = ExtractionPool(processes=1, timeout=1, max_tasks_per_child=0,
+                                     preload_langs=["en", "es"], start_method="fork")
+    yield extraction_pool
+    extraction_pool.close()
+
+
+def test_worker_loads_models_once(pool):
+    """
+    GIVEN an extraction pool with preloaded languages,
+    WHEN two tasks run in its worker,
+    THEN the worker has loaded the transformer and the spaCy models once, before the first task.
+    """
+    assert pool.run(preloaded_models) == ["LaBSE", "spacy_en", "spacy_es"]
+    assert pool.run(preloaded_models) == ["LaBSE", "spacy_en", "spacy_es"]
+
+
+def test_timed_out_worker_is_replaced(pool):
+    """
+    GIVEN an extraction pool with a single worker and a 1 second timeout,
+    WHEN a task runs for longer than the timeout,
+    THEN a TimeoutError is raised after the timeout,
+    AND the worker is replaced, so that the next task does not wait for the first one.
+    """
+    first_pid = pool.run(worker_pid)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        pool.run(sleep, 30)
+    assert pool.run(worker_pid) != first_pid
+    assert time.monotonic() - start < 10
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_crashed_worker_fails_fast(pool):
+    """
+    GIVEN an extraction pool with a 60 seconds timeout,
+    WHEN the worker running a task dies,
+    THEN a WorkerCrashedError is raised without waiting for the timeout,
+    AND the next task runs in a new worker.
+    """
+    pool.timeout = 60
+    start = time.monotonic()
+    with pytest.raises(WorkerCrashedError):
+        pool.run(crash)
+    assert time.monotonic() - start < 10
+    assert pool.run(sleep, 0) == 0
+    assert pool.stats()["crashes"] == 1
+
+
+def test_default_pool_size_shares_the_cpus_of_the_host():
+    """
+    GIVEN a host with 8 CPUs,
+    WHEN the extraction pools of 1, 4 and 16 HTTP workers are sized,
+    THEN the pools of all the workers add up to the CPUs, with at least one process each.
+    """
+    assert [default_pool_size(workers, cpus=8) for workers in (1, 4, 16)] == [8, 2, 1]
@@ -1823,3 +1823,27 @@ def test_mt_unmatched_terms():
             "MT",
         ],
     }
+
+
+def test_extraction_pool_timeout(monkeypatch):
+    """
+    GIVEN the process extraction engine, whose task times out,
+    WHEN a bitext is sent to /biterms,
+    THEN the response is a 504 with the timeout message.
+    """
+    import helpers
+
+    class TimedOutPool:
+        def run(self, func, *args):
+            raise TimeoutError("Extraction task timed out after 300 seconds.")
+
+    monkeypatch.setattr(helpers, "extraction_pool", TimedOutPool())
+    pload = {
+        "src_texts": ["Il panda gigante è un mammifero."],
+        "tgt_texts": ["The giant panda is a mammal."],
+        "src_lang": "it",
+        "tgt_lang": "en",
+    }
+    r = client.post("/api/v1_0/biterms", headers=headers, json=pload)
+    assert r.status_code == 504
+    assert r.json() == {"detail": "Extraction task timed out after 300 seconds."}
@@ -0,0 +1,55 @@
+"""
+ONNX encoder unit tests.
+"""
+import numpy as np
+import pytest
+
+from tm2tb.onnx_model import OnnxSentenceEncoder
+
+
+class FakeTokenizer:
+    """Tokenizer whose only input is the length of each text."""
+    def __call__(self, texts, **kwargs):
+        return {"input_ids": np.array([[len(text)] for text in texts])}
+
+
+class FakeSession:
+    """Inference session returning [length, 0] for each text."""
+    def get_outputs(self):
+        return [type("Output", (), {"shape": ["batch", 2]})]
+
+    def run(self, output_names, inputs):
+        lengths = inputs["input_ids"][:, 0]
+        return [np.stack([lengths, np.zeros_like(lengths)], axis=1).astype(np.float32)]
+
+
+@pytest.fixture
+def encoder():
+    """An ONNX encoder with a fake tokenizer and inference session."""
+    encoder = OnnxSentenceEncoder.__new__(OnnxSentenceEncoder)
+    encoder.tokenizer, encoder.session = FakeTokenizer(), FakeSession()
+    encoder.max_seq_length, encoder.input_names = 8, ["input_ids"]
+    return encoder
+
+
+def test_encode_options(encoder):
+    """
+    GIVEN an ONNX encoder,
+    WHEN sentences are encoded with normalize_embeddings or convert_to_numpy=False,
+    THEN the embeddings are scaled to unit length or returned as a list of arrays.
+    """
+    assert encoder.encode(["ab", "abcd"])[:, 0].tolist() == [2, 4]
+    assert encoder.encode(["ab", "abcd"], normalize_embeddings=True)[:, 0].tolist() == [1, 1]
+    embeddings = encoder.encode(["ab", "abcd"], convert_to_numpy=False)
+    assert isinstance(embeddings, list) and [embedding[0] for embedding in embeddings] == [2, 4]
+    assert encoder.encode("abc", normalize_embeddings=True).tolist() == [1, 0]
+
+
+def test_unsupported_options_are_rejected(encoder):
+    """
+    GIVEN an ONNX encoder,
+    WHEN sentences are encoded with an option it does not implement,
+    THEN a TypeError is raised instead of ignoring the option.
+    """
+    with pytest.raises(TypeError):
+        encoder.encode(["ab"], output_value="token_embeddings")
@@ -0,0 +1,32 @@
+"""
+Embedding similarity unit tests.
+"""
+import numpy as np
+from tm2tb.similarity import normalize_rows, top_k_matches
+
+
+def test_top_k_matches_in_blocks():
+    """
+    GIVEN source and target embeddings,
+    WHEN the top 2 matches are computed in blocks of one source row,
+    THEN they are the same as those of the full similarity matrix, from the most similar.
+    """
+    rng = np.random.default_rng(0)
+    src = normalize_rows(rng.standard_normal((5, 8)))
+    tgt = normalize_rows(rng.standard_normal((7, 8)))
+    indices, similarities = top_k_matches(src, tgt, k=2, block_rows=1)
+    full = src @ tgt.T
+    assert indices.tolist() == np.argsort(-full, axis=1)[:, :2].tolist()
+    assert np.allclose(similarities, np.sort(full, axis=1)[:, ::-1][:, :2])
+
+
+def test_best_match_ties_go_to_the_first_target():
+    """
+    GIVEN two identical target embeddings,
+    WHEN the best match of a source embedding is computed,
+    THEN the first target is returned, as with argmax.
+    """
+    indices, similarities = top_k_matches(np.array([[1, 0]], dtype=np.float32),
+                                          np.array([[0, 1], [1, 0], [1, 0]], dtype=np.float32))
+    assert indices.tolist() == [[1]]
+    assert similarities.tolist() == [[1.0]]
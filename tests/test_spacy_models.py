@@ -0,0 +1,56 @@
+"""
+spaCy model registry unit tests.
+"""
+import threading
+import time
+
+from tm2tb import spacy_models
+from tm2tb.spacy_models import SpacyModelRegistry
+
+MODEL_NAMES = {"en": "en_fake", "de": "de_fake", "fr": "fr_fake"}
+
+
+class FakeLoader:
+    """Fake spaCy loader that grows a fake resident memory by 100 MB per model."""
+    def __init__(self, monkeypatch, seconds=0.0):
+        self.resident = 0
+        self.seconds = seconds
+        monkeypatch.setattr(spacy_models, "_resident_memory", lambda: self.resident)
+
+    def __call__(self, model_name):
+        self.resident += 50 * 1024**2
+        time.sleep(self.seconds)
+        self.resident += 50 * 1024**2
+        return model_name
+
+
+def test_least_recently_used_model_is_unloaded(monkeypatch):
+    """
+    GIVEN a registry with a memory budget of two 100 MB models,
+    WHEN a third model is loaded,
+    THEN the least recently used model is unloaded,
+    AND the unload callbacks are called with its language.
+    """
+    registry = SpacyModelRegistry(MODEL_NAMES, memory_budget_mb=250, loader=FakeLoader(monkeypatch))
+    unloaded = []
+    registry.on_unload.append(unloaded.append)
+    registry.preload(["en", "de"])
+    registry.get("en")
+    assert registry.get("fr") == "fr_fake"
+    assert registry.resident_models() == ["en", "fr"]
+    assert unloaded == ["de"]
+
+
+def test_concurrent_loads_are_measured_separately(monkeypatch):
+    """
+    GIVEN a registry whose models take 100 MB each to load,
+    WHEN two models are loaded by two threads at the same time,
+    THEN the memory of each model does not include the other one.
+    """
+    registry = SpacyModelRegistry(MODEL_NAMES, loader=FakeLoader(monkeypatch, seconds=0.1))
+    threads = [threading.Thread(target=registry.get, args=(lang,)) for lang in ("en", "de")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [info["memory_mb"] for info in registry.stats().values()] == [100.0, 100.0]
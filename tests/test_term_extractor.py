@@ -0,0 +1,196 @@
+"""
+Term extractor unit tests.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pytest
+import spacy
+from tm2tb.language_resources import LanguageResources, bounded_patterns
+from tm2tb.term_extractor import TermExtractor
+from tm2tb.term_table import TermTable
+
+Candidate = namedtuple("Candidate", ["text"])
+
+
+def test_trim_spans_keeps_longer_terms():
+    """
+    GIVEN the term "panda", only found inside "giant panda",
+    WHEN the spans are trimmed,
+    THEN "panda" is discarded and "giant panda" is kept.
+    """
+    spans = [Candidate("giant panda"), Candidate("panda")]
+    occurrences = {"giant panda": [(0, 4, 15)], "panda": [(0, 10, 15)]}
+    assert TermExtractor._trim_spans(spans, occurrences) == [Candidate("giant panda")]
+
+
+def test_trim_spans_keeps_terms_found_on_their_own():
+    """
+    GIVEN the term "panda", found inside "giant panda" and on its own in another doc,
+    WHEN the spans are trimmed,
+    THEN both terms are kept.
+    """
+    spans = [Candidate("giant panda"), Candidate("panda")]
+    occurrences = {"giant panda": [(0, 4, 15)], "panda": [(0, 10, 15), (1, 0, 5)]}
+    assert TermExtractor._trim_spans(spans, occurrences) == spans
+
+
+def test_trim_spans_keeps_overlapping_terms():
+    """
+    GIVEN two terms that overlap without one containing the other,
+    WHEN the spans are trimmed,
+    THEN both terms are kept.
+    """
+    spans = [Candidate("product development"), Candidate("development team")]
+    occurrences = {"product development": [(0, 6, 25)], "development team": [(0, 14, 30)]}
+    assert TermExtractor._trim_spans(spans, occurrences) == spans
+
+
+def test_bounded_patterns_respect_span_range():
+    """
+    GIVEN a pattern with a repeated adjective token,
+    WHEN it is expanded for a span range of 2 to 3 tokens,
+    THEN the expansions have 2 and 3 tokens and no repetition operator.
+    """
+    adj = {"POS": "ADJ", "OP": "*"}
+    noun = {"POS": "NOUN"}
+    patterns = bounded_patterns([adj, noun], (2, 3))
+    assert patterns == [[{"POS": "ADJ"}, noun], [{"POS": "ADJ"}, {"POS": "ADJ"}, noun]]
+
+
+def test_disabled_pipes_keep_ner_only_for_entities():
+    """
+    GIVEN a pipeline with a tagger, a parser and an entity recognizer,
+    WHEN the components that a request does not need are computed,
+    THEN the parser is always disabled,
+    AND the entity recognizer is disabled unless entities are included.
+    """
+    nlp = spacy.blank("en")
+    for name in ("tagger", "parser", "ner"):
+        nlp.add_pipe(name)
+    resources = LanguageResources("en", nlp)
+    assert resources.disabled_pipes(include_entities=False) == ["parser", "ner"]
+    assert resources.disabled_pipes(include_entities=True) == ["parser"]
+
+
+def test_term_table_take_selects_rows_of_every_column():
+    """
+    GIVEN a term table with ranks,
+    WHEN the rows with a positive rank are taken,
+    THEN every column keeps the same rows.
+    """
+    table = TermTable(texts=np.array(["panda", "team", "bear"], dtype=object),
+                      lemmas=np.array(["panda", "team", "bear"], dtype=object),
+                      labels=np.array(["", "", ""], dtype=object),
+                      tags=[["NOUN"], ["NOUN"], ["NOUN"]],
+                      frequencies=np.array([2, 1, 1]),
+                      docs_idx=[{0}, {0}, {1}],
+                      embeddings=np.eye(3),
+                      ranks=np.array([0.5, -0.1, 0.2]))
+    selected = table.take(table.ranks > 0)
+    assert selected.texts.tolist() == ["panda", "bear"]
+    assert selected.docs_idx == [{0}, {1}]
+    assert selected.embeddings.tolist() == [[1, 0, 0], [0, 0, 1]]
+    assert selected.similarities is None
+
+
+def test_mmr_rank_prefers_diverse_terms():
+    """
+    GIVEN two near-duplicate relevant terms and a less relevant, different term,
+    WHEN two terms are selected with Maximal Marginal Relevance,
+    THEN the most relevant term and the different term keep their rank,
+    AND the rank of the near-duplicate is halved.
+    """
+    embeddings = np.array([[1, 0], [0.99, 0.1], [0, 1]])
+    doc_similarities = np.array([0.9, 0.85, 0.5])
+    ranks = np.array([0.8, 0.7, 0.4])
+    mmr_ranks = TermExtractor._mmr_rank(embeddings, doc_similarities, ranks, top_n=2)
+    assert mmr_ranks.tolist() == [0.8, 0.35, 0.4]
+
+
+def test_mmr_rank_selects_no_term_when_top_n_is_zero():
+    """
+    GIVEN three terms,
+    WHEN they are ranked with MMR and top_n=0,
+    THEN no term is selected: all of them get half of their rank.
+    """
+    embeddings = np.array([[1, 0], [0, 1], [1, 1]], dtype=np.float32)
+    mmr_ranks = TermExtractor._mmr_rank(embeddings, np.array([.9, .5, .7]), np.array([.8, .6, .4]), top_n=0)
+    assert mmr_ranks.tolist() == [0.4, 0.3, 0.2]
+
+
+@pytest.mark.parametrize("scoring, message", [({"top_n": -1}, "top_n"),
+                                             ({"diversity": 1.5}, "diversity"),
+                                             ({"diversity": -0.1}, "diversity")])
+def test_score_candidates_rejects_invalid_mmr_parameters(scoring, message):
+    """
+    GIVEN a negative top_n or a diversity outside [0, 1],
+    WHEN the candidates are scored,
+    THEN a ValueError naming the parameter is raised.
+    """
+    extractor = TermExtractor(["giant panda"], lang="en")
+    with pytest.raises(ValueError, match=message):
+        extractor.score_candidates([], np.ones((1, 2)), np.zeros((0, 2)), ranking="mmr", **scoring)
+
+
+def test_pipe_kwargs_parse_small_inputs_in_process():
+    """
+    GIVEN an extractor without an explicit number of processes,
+    WHEN a handful of texts is parsed,
+    THEN they are parsed in a single process.
+    """
+    texts = ["The giant panda."] * 10
+    assert TermExtractor(texts, lang="en")._pipe_kwargs(texts)["n_process"] == 1
+
+
+def test_pipe_kwargs_split_batches_across_processes():
+    """
+    GIVEN an extractor with 4 processes and a batch size of 256,
+    WHEN 600 texts are parsed,
+    THEN the batches hold 150 texts, so that every process gets one.
+    """
+    texts = ["The giant panda."] * 600
+    extractor = TermExtractor(texts, lang="en", batch_size=256, n_process=4)
+    assert extractor._pipe_kwargs(texts) == {"batch_size": 150, "n_process": 4}
+
+
+def test_text_windows_end_after_sentences():
+    """
+    GIVEN a text longer than the window size,
+    WHEN it is cut in windows,
+    THEN the windows end after a sentence, or else at a space,
+    AND their offsets point to their position in the text.
+    """
+    text = "The giant panda. It lives in the mountainous regions of Sichuan"
+    windows = list(TermExtractor._text_windows(text, chunk_chars=30))
+    assert [window for _, window in windows] == ["The giant panda.", "It lives in the mountainous", "regions of Sichuan"]
+    assert all(text[offset:offset + len(window)] == window for offset, window in windows)
+
+
+def test_collect_spans_copies_kept_spans_of_windowed_texts():
+    """
+    GIVEN the same sentence parsed as a whole text and as the window of a long text,
+    WHEN their candidates are collected with a filter that rejects one-word spans,
+    THEN the candidates of the whole text keep their doc,
+    AND the kept candidates of the window are copied out of it, the rejected ones only counted.
+    """
+    nlp = spacy.blank("en")
+    extractor = TermExtractor(["giant panda"], lang="en")
+    extractor.resources = LanguageResources("en", nlp)
+
+    def parse(text):
+        doc = nlp(text)
+        for token, pos in zip(doc, ["ADJ", "NOUN"]):
+            token.pos_ = pos
+        return doc
+
+    whole, window = parse("giant panda"), parse("giant panda")
+    spans, _ = extractor._collect_spans([(whole, (0, 0, False))], span_range=(1, 2),
+                                        keep=lambda span: len(span) > 1)
+    assert all(span.doc is whole for span in spans)
+
+    spans, occurrences = extractor._collect_spans([(window, (0, 500, True))], span_range=(1, 2),
+                                                  keep=lambda span: len(span) > 1)
+    assert [span.text for span in spans] == ["giant panda"]
+    assert spans[0].doc is not window
+    assert occurrences["panda"] == [(0, 506, 511)]
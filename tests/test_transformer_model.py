@@ -0,0 +1,94 @@
+"""
+Transformer model unit tests.
+"""
+import os
+import sys
+import threading
+import types
+
+from tm2tb.transformer_model import TransformerModel
+
+
+def fake_weights_modules(monkeypatch, conversions):
+    """Install minimal torch, safetensors and transformers modules that record the conversions."""
+    def save_file(tensors, path, metadata=None):
+        conversions.append(path)
+        with open(path, "w") as fw:
+            fw.write("weights")
+
+    torch = types.ModuleType("torch")
+    torch.load = lambda path, map_location=None: {}
+    safetensors = types.ModuleType("safetensors")
+    safetensors_torch = types.ModuleType("safetensors.torch")
+    safetensors_torch.save_file = save_file
+    transformers = types.ModuleType("transformers")
+    transformers_utils = types.ModuleType("transformers.utils")
+    transformers_utils.SAFE_WEIGHTS_NAME = "model.safetensors"
+    for name, module in [("torch", torch), ("safetensors", safetensors), ("safetensors.torch", safetensors_torch),
+                         ("transformers", transformers), ("transformers.utils", transformers_utils)]:
+        monkeypatch.setitem(sys.modules, name, module)
+
+
+def test_concurrent_safetensors_conversion(tmp_path, monkeypatch):
+    """
+    GIVEN a saved model with a pytorch_model.bin checkpoint,
+    WHEN four workers convert its weights to safetensors at the same time,
+    THEN the weights are converted once, without leftover temporary files,
+    AND the original checkpoint is kept.
+    """
+    monkeypatch.chdir(tmp_path)
+    conversions = []
+    fake_weights_modules(monkeypatch, conversions)
+    model = TransformerModel("fake")
+    os.makedirs(model.model_path)
+    with open(os.path.join(model.model_path, "pytorch_model.bin"), "w") as fw:
+        fw.write("checkpoint")
+
+    threads = [threading.Thread(target=model._convert_to_safetensors) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(conversions) == 1
+    assert sorted(os.listdir(model.model_path)) == ["model.safetensors", "pytorch_model.bin"]
+
+
+def test_tokenizer_and_weights_are_timed_separately(tmp_path, monkeypatch):
+    """
+    GIVEN a saved model whose Transformer module loads a tokenizer and weights,
+    WHEN the model is loaded,
+    THEN the tokenizer, the weights and the other modules are timed as separate phases,
+    AND the transformers loaders are restored afterwards.
+    """
+    monkeypatch.chdir(tmp_path)
+    st_transformer = types.ModuleType("sentence_transformers.models.Transformer")
+
+    class AutoTokenizer:
+        @staticmethod
+        def from_pretrained(path):
+            return "tokenizer"
+
+    class AutoModel:
+        @staticmethod
+        def from_pretrained(path):
+            return "weights"
+
+    class SentenceTransformer:
+        def __init__(self, path):
+            self.loaded = [st_transformer.AutoTokenizer.from_pretrained(path),
+                           st_transformer.AutoModel.from_pretrained(path)]
+
+    st_transformer.AutoTokenizer, st_transformer.AutoModel = AutoTokenizer, AutoModel
+    sentence_transformers = types.ModuleType("sentence_transformers")
+    sentence_transformers.SentenceTransformer = SentenceTransformer
+    for name, module in [("torch", types.ModuleType("torch")), ("sentence_transformers", sentence_transformers),
+                         ("sentence_transformers.models", types.ModuleType("sentence_transformers.models")),
+                         ("sentence_transformers.models.Transformer", st_transformer)]:
+        monkeypatch.setitem(sys.modules, name, module)
+    model = TransformerModel("fake")
+    os.makedirs(model.model_path)
+
+    assert model.load().loaded == ["tokenizer", "weights"]
+    assert set(model.timings) == {"torch_import", "sentence_transformers_import", "tokenizer", "weights", "modules"}
+    assert (st_transformer.AutoTokenizer, st_transformer.AutoModel) == (AutoTokenizer, AutoModel)
@@ -1,11 +1,45 @@
 """
 TM2TB initialization
 """
-from tm2tb.transformer_model import TransformerModel
+from tm2tb.transformer_model import TransformerModel, TRANSFORMER_PRELOAD
+from tm2tb.embedding_cache import CachedEncoder
+from tm2tb.embedding_store import EmbeddingStore, EMBEDDING_STORE_PATH
+from tm2tb.encoding_scheduler import EncodingScheduler, ENCODING_BATCH_WAIT_MS
 
-trf_model = TransformerModel("LaBSE").load()
+trf_loader = TransformerModel("LaBSE")
+# LaBSE is loaded on first use, unless preloading is configured.
+trf_encoder = trf_loader.load_lazy()
+# Cache misses of concurrent requests are encoded in shared batches, if configured.
+if ENCODING_BATCH_WAIT_MS > 0:
+    trf_encoder = EncodingScheduler(trf_encoder)
+trf_model = CachedEncoder(trf_encoder, trf_loader.encoder_name,
+                          store=EmbeddingStore(EMBEDDING_STORE_PATH, trf_loader.encoder_name)
+                          if EMBEDDING_STORE_PATH else None)
 
-from tm2tb.spacy_models import get_spacy_model
+from tm2tb.spacy_models import get_spacy_model, registry as spacy_registry, SPACY_PRELOAD
+from tm2tb.language_resources import get_language_resources, preload_language_resources
+
+
+def startup_timings():
+    """Duration in seconds of each model loading phase (torch import, tokenizer, weights, spaCy)."""
+    timings = dict(trf_loader.timings)
+    for lang, info in spacy_registry.stats().items():
+        timings[f'spacy_{lang}'] = info['load_time']
+    return timings
+
+
+def log_startup_timings():
+    print('Startup timings (s): ' + ', '.join(f'{phase}={seconds}' for phase, seconds in startup_timings().items()))
+
+
+if TRANSFORMER_PRELOAD:
+    trf_model.model.preload()
+spacy_registry.preload(SPACY_PRELOAD)
+preload_language_resources(SPACY_PRELOAD)
+if TRANSFORMER_PRELOAD or SPACY_PRELOAD:
+    log_startup_timings()
+
+from tm2tb.term_table import TermTable
 from tm2tb.term_extractor import TermExtractor
 from tm2tb.biterm_extractor import BitermExtractor
 
@@ -7,16 +7,79 @@ Classes:
 Functions:
     extract_terms(List[str], **kwargs)
 """
+import os
 import requests
+import threading
 import uuid
-from collections import defaultdict
-from collections import namedtuple
 from typing import List
-from itertools import groupby
 import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
+from threadpoolctl import ThreadpoolController
 from tm2tb import TermExtractor
+from tm2tb.encoding import encode_texts
+from tm2tb.lazy_thread_pool import LazyThreadPool
+from tm2tb.similarity import top_k_matches
+
+# Threads that run the source side of biterm extractions while the calling thread
+# runs the target side. 0 runs both sides one after the other.
+BITERM_SIDE_THREADS = int(os.environ.get("TM2TB_BITERM_SIDE_THREADS", 2))
+# OpenMP threads of each side while both sides run at the same time
+BITERM_SIDE_OMP_THREADS = int(os.environ.get("TM2TB_BITERM_SIDE_OMP_THREADS",
+                                             max(1, (os.cpu_count() or 1) // 2)))
+
+RESPONSE_COLUMNS = ('src_terms', 'src_labels', 'src_frequencies', 'src_clusters',
+                    'tgt_terms', 'similarities', 'frequencies', 'ranks', 'origins')
+
+
+_side_threads = LazyThreadPool(BITERM_SIDE_THREADS, thread_name_prefix="biterm-side")
+
+# OpenMP thread limits are set per thread, so each side limits its own thread.
+# BLAS limits would apply to the whole process, including the encoding of other
+# requests, so they are left alone. The OpenMP libraries are looked up once.
+_omp_controller = None
+_omp_controller_lock = threading.Lock()
+
+
+def _with_omp_limits(func):
+    """Wrap a side stage so that it runs with at most BITERM_SIDE_OMP_THREADS OpenMP threads."""
+    global _omp_controller
+    if _omp_controller is None:
+        with _omp_controller_lock:
+            if _omp_controller is None:
+                _omp_controller = ThreadpoolController().select(user_api='openmp')
+
+    def limited():
+        with _omp_controller.limit(limits=BITERM_SIDE_OMP_THREADS):
+            return func()
+    return limited
+
+
+def _run_sides(src_func, tgt_func):
+    """
+    Run the source and target stages of an extraction, concurrently if side threads are enabled.
+
+    The source stage runs in a side thread and the target stage in the calling thread.
+    If all the side threads are busy with other extractions, both stages run in the
+    calling thread. Errors are raised as if the stages had run one after the other.
+    """
+    if BITERM_SIDE_THREADS <= 0:
+        return src_func(), tgt_func()
+    src_future = _side_threads.try_submit(_with_omp_limits(src_func))
+    if src_future is None:
+        return src_func(), tgt_func()
+    try:
+        tgt_result = _with_omp_limits(tgt_func)()
+    finally:
+        # Wait for the source stage in any case; its error comes first
+        src_result = src_future.result()
+    return src_result, tgt_result
+
+
+def _alphabetical_order(texts):
+    """Position of each text in the sorted texts."""
+    order = np.empty(len(texts), dtype=np.intp)
+    order[np.argsort(texts, kind='stable')] = np.arange(len(texts))
+    return order
 
 
 class BitermExtractor:
@@ -45,6 +108,11 @@ class BitermExtractor:
                       return_unmatched_terms=True,
                       mt_unmatched_terms=False,
                       collapse_lemmas=False,
+                      ranking='simple',
+                      top_n=None,
+                      diversity=.9,
+                      cluster_method='kmeans',
+                      as_columns=False,
                       **kwargs):
         """
         Extract biterms from an unaligned pair of a source text and a target text.
@@ -61,212 +129,176 @@ class BitermExtractor:
             If True, src_terms without a match are returned
         collapse_lemmas : bool, optional
             If True, the list of resulting terms is collapsed using their lemmas. The default is False
+        ranking, top_n, diversity : optional
+            Ranking of the source and target terms, see TermExtractor.extract_terms. The default is 'simple'
+        cluster_method : str, optional
+            Clustering of the source and target terms, see tm2tb.clustering. The default is 'kmeans'
+        as_columns : bool, optional
+            If True, the biterms are returned as a dict of lists instead of a dataframe. The default is False
         **kwargs : dict
             See the parameters accepted by TermExtractor.
 
         Returns
         -------
-        terms : list
-            Pandas dataframe representing biterms and their metadata.
+        terms : pandas.DataFrame or dict
+            Pandas dataframe representing biterms and their metadata,
+            or a dict of lists keyed by column name if as_columns is True.
 
         """
         src_texts, tgt_texts = zip(*self.input_)
 
-        # Get source terms
+        # Get source and target term candidates
         src_extractor = TermExtractor(list(src_texts), lang=self.src_lang)
-        src_terms = src_extractor.extract_terms(**kwargs)
-
-        # Get target terms
         tgt_extractor = TermExtractor(list(tgt_texts), lang=self.tgt_lang)
-        tgt_terms = tgt_extractor.extract_terms(**kwargs)
-
-        # Get source/target terms similarities
-        sm = self._get_similarity_matrix(src_terms, tgt_terms)
-
-        # Get the top biterm matches from the similarity matrix
-        biterms_idx = list(
-            zip(range(len(src_terms)), np.argmax(sm, axis=1), np.max(sm, axis=1)))
-        biterms_matches = [(list(src_terms)[i], list(tgt_terms)[i_], n)
-                           for (i, i_, n) in biterms_idx]
-
-        # Collect biterm frequencies, similarities and strings
-        biterms_freqs_dict = defaultdict(int)
-        biterms_sims_dict = defaultdict(set)
-        biterms_strings_dict = defaultdict(set)
-        for src_term, tgt_term, biterm_similarity in biterms_matches:
-            biterms_strings_dict[(src_term.text, tgt_term.text)] = (
-                src_term, tgt_term)
-            biterms_sims_dict[(src_term.text, tgt_term.text)
-                              ] = round(biterm_similarity, 4)
-            biterms_freqs_dict[(src_term.text, tgt_term.text)] += 1
-
-        # Build, prune and filter biterms
-        BiTerm = namedtuple('BiTerm', ['src_term', 'src_tags', 'src_rank',
-                                       'src_label', 'src_frequency', 'src_cluster',
-                                       'tgt_term', 'tgt_tags', 'tgt_rank',
-                                       'similarity', 'frequency', 'biterm_rank', 'origin'])
-        biterms = self._build_biterms(BiTerm, biterms_freqs_dict, biterms_sims_dict,
-                                      biterms_strings_dict, similarity_min)
-        biterms = self._prune_biterms(biterms, 'src')
-        biterms = self._prune_biterms(biterms, 'tgt')
+        src_candidates, tgt_candidates = _run_sides(lambda: src_extractor.extract_candidates(**kwargs),
+                                                    lambda: tgt_extractor.extract_candidates(**kwargs))
+        src_chunks, src_chunks_weights, src_spans = src_candidates
+        tgt_chunks, tgt_chunks_weights, tgt_spans = tgt_candidates
+
+        # Encode all the doc chunks and spans of both sides in a single pass, outside the
+        # side threads, so that torch keeps its intra-op threads to itself
+        groups = [src_chunks, [span.text for span in src_spans],
+                  tgt_chunks, [span.text for span in tgt_spans]]
+        # Only the span embeddings are kept in the embedding store
+        persist = [is_spans for i, group in enumerate(groups) for is_spans in [i % 2 == 1] * len(group)]
+        embeddings = np.split(encode_texts([text for group in groups for text in group], persist=persist),
+                              np.cumsum([len(group) for group in groups])[:-1])
+        src_docs_embeddings, src_spans_embeddings, tgt_docs_embeddings, tgt_spans_embeddings = embeddings
+
+        # Get source and target terms
+        scoring = {'ranking': ranking, 'top_n': top_n, 'diversity': diversity, 'cluster_method': cluster_method}
+        src_table, tgt_table = _run_sides(
+            lambda: src_extractor.score_candidates(src_spans, src_docs_embeddings, src_spans_embeddings,
+                                                   docs_weights=src_chunks_weights, return_table=True, **scoring),
+            lambda: tgt_extractor.score_candidates(tgt_spans, tgt_docs_embeddings, tgt_spans_embeddings,
+                                                   docs_weights=tgt_chunks_weights, return_table=True, **scoring))
+
+        # Get the most similar target term of each source term, one block of source terms at a time
+        best_tgt_idx, best_similarities = top_k_matches(src_table.embeddings, tgt_table.embeddings)
+        similarities = np.round(best_similarities[:, 0].astype(np.float64), 4)
+
+        # Keep the similar biterms, and the most similar source term of each target term
+        src_idx, tgt_idx, similarities = self._prune_biterms(src_table.texts, tgt_table.texts,
+                                                             best_tgt_idx[:, 0], similarities, similarity_min)
+
+        # Build biterms as columns
+        biterms = self._build_biterms(src_table, tgt_table, src_idx, tgt_idx, similarities)
         if return_unmatched_terms is True:
-            biterms, biterms_strings_dict = self._return_unmatched_terms(BiTerm, src_terms,
-                                                                         biterms, biterms_strings_dict)
+            biterms = self._return_unmatched_terms(biterms, src_table, src_idx)
         if collapse_lemmas is True:
-            biterms = self._collapse_biterm_lemmas(
-                biterms, biterms_strings_dict)
+            biterms = self._collapse_biterm_lemmas(biterms)
         if return_unmatched_terms is True and mt_unmatched_terms is True:
             biterms = self._mt_unmatched_terms(biterms)
+        if as_columns is True:
+            return self._return_as_columns(biterms)
         return self._return_as_df(biterms)
 
     @staticmethod
-    def _get_similarity_matrix(src_spans, tgt_spans):
+    def _build_biterms(src_table, tgt_table, src_idx, tgt_idx, similarities):
         """
-        Generate a similarity matrix of source and target term candidates.
+        Gather the metadata of the matched source and target terms.
 
         Parameters
         ----------
-        src_spans : list
-            List of spans of type 'spacy.tokens.span.Span' from the source side
-        tgt_spans : list
-            List of spans of type 'spacy.tokens.span.Span' from the target side
+        src_table : TermTable
+            Source terms.
+        tgt_table : TermTable
+            Target terms.
+        src_idx, tgt_idx : numpy.ndarray
+            Source and target term index of each biterm.
+        similarities : numpy.ndarray
+            Similarity of each biterm.
 
         Returns
         -------
-        similarity_matrix : numpy.ndarray
-            Similarity matrix produced by calculating the cosine similarity
-            of the source and the target spans embeddings.
-
+        biterms : dict
+            Biterms as columns (numpy arrays of the same length), keyed by the response column names.
         """
-        src_embeddings = [span._.embedding for span in src_spans]
-        tgt_embeddings = [span._.embedding for span in tgt_spans]
-        similarity_matrix = cosine_similarity(src_embeddings, tgt_embeddings)
-        return similarity_matrix
+        return {'src_terms': src_table.texts[src_idx],
+                'src_lemmas': src_table.lemmas[src_idx],
+                'src_labels': src_table.labels[src_idx],
+                'src_frequencies': src_table.frequencies[src_idx],
+                'src_clusters': src_table.clusters[src_idx],
+                'tgt_terms': tgt_table.texts[tgt_idx],
+                'similarities': similarities,
+                # Each source term has a single best match, so biterms occur once
+                'frequencies': np.ones(len(src_idx), dtype=int),
+                'ranks': ((src_table.ranks[src_idx] + tgt_table.ranks[tgt_idx]) / 2) * similarities,
+                'origins': np.full(len(src_idx), 'similarity', dtype=object)}
 
     @staticmethod
-    def _build_biterms(BiTerm, biterms_freqs_dict, biterms_sims_dict, biterms_strings_dict, similarity_min):
+    def _prune_biterms(src_texts, tgt_texts, best_tgt_idx, similarities, similarity_min):
         """
-        Gather the metadata from the biterms and build the final biterms list.
+        Keep the biterms above the similarity threshold, and the most similar source term for each target term.
 
         Parameters
         ----------
-        biterms_freqs_dict: dict representing biterms frequencies
-        biterms_sims_dict: dict representing biterms similarities
-        biterms_strings_dict: dict representing biterms strings
+        src_texts : numpy.ndarray
+            Source terms.
+        tgt_texts : numpy.ndarray
+            Target terms.
+        best_tgt_idx : numpy.ndarray
+            Index of the most similar target term of each source term.
+        similarities : numpy.ndarray
+            Similarity of each source term to its most similar target term.
+        similarity_min : float
+            Minimum similarity of the biterms.
 
         Returns
         -------
-        biterms : list
-            List of named tuples representing the extracted bilingual terms.
+        src_idx, tgt_idx, similarities : numpy.ndarray
+            Source index, target index and similarity of the kept biterms, ordered by target term.
+            Ties between source terms go to the first one in alphabetical order.
         """
-        biterms = []
-        for biterm_, similarity in biterms_sims_dict.items():
-            if similarity >= similarity_min:
-                src_term = biterm_[0]
-                tgt_term = biterm_[1]
-                spans = biterms_strings_dict[biterm_]
-                src_span = spans[0]
-                tgt_span = spans[1]
-                src_tags = [t.pos_ for t in src_span]
-                tgt_tags = [t.pos_ for t in tgt_span]
-                src_rank = src_span._.rank
-                tgt_rank = tgt_span._.rank
-                src_label = src_span.label_
-                src_frequency = src_span._.frequency
-                src_cluster = src_span._.cluster
-                frequency = biterms_freqs_dict[biterm_]
-                biterm_rank = biterm_rank = biterm_rank = (
-                    (src_rank + tgt_rank) / 2) * similarity
-                origin = 'similarity'
-                biterm = BiTerm(src_term, src_tags, src_rank,
-                                src_label, src_frequency, src_cluster,
-                                tgt_term, tgt_tags, tgt_rank,
-                                similarity, frequency, biterm_rank, origin)
-                biterms.append(biterm)
-        if len(biterms) == 0:
+        src_idx = np.flatnonzero(similarities >= similarity_min)
+        if len(src_idx) == 0:
             raise ValueError('No biterms found.')
-        return biterms
-
-    @staticmethod
-    def _prune_biterms(biterms, side):
-        """
-        Keep the most similar target term for each source term (and viceversa).
-
-        Parameters
-        ----------
-        biterms : list
-            List of named tuples.
-        side : str
-            String representing which "side" to prune: "src" or "tgt".
-
-        Returns
-        -------
-        biterms_ : list
-            Pruned list of named tuples in the same format.
-        """
-        if side == 'src':
-            def keyfunc(k): return k.src_term
-            biterms = sorted(biterms, key=keyfunc)
-        else:
-            def keyfunc(k): return k.tgt_term
-            biterms = sorted(biterms, key=keyfunc)
-
-        biterms_ = []
-        for _, group in groupby(biterms, keyfunc):
-            # Sort biterms group by similarity
-            group = sorted(group,
-                           key=lambda group: group.similarity,
-                           reverse=True)
-            # Take first biterm
-            best_biterm = list(group)[0]
-            biterms_.append(best_biterm)
-        return biterms_
+        src_order = _alphabetical_order(src_texts)
+        tgt_idx = best_tgt_idx[src_idx]
+        # Sort by target term, similarity (descending) and source term, and keep the first of each target term
+        order = np.lexsort((src_order[src_idx], -similarities[src_idx], tgt_idx))
+        src_idx, tgt_idx = src_idx[order], tgt_idx[order]
+        first = np.ones(len(src_idx), dtype=bool)
+        first[1:] = tgt_idx[1:] != tgt_idx[:-1]
+        src_idx, tgt_idx = src_idx[first], tgt_idx[first]
+        order = np.argsort(_alphabetical_order(tgt_texts)[tgt_idx], kind='stable')
+        return src_idx[order], tgt_idx[order], similarities[src_idx[order]]
 
     @staticmethod
-    def _return_unmatched_terms(BiTerm, src_terms, biterms, biterms_strings_dict):
+    def _return_unmatched_terms(biterms, src_table, src_idx):
         """Add unmatched source terms to biterms."""
-        for span in src_terms:
-            if span.text not in [biterms[n].src_term for n in range(len(biterms))]:
-                src_term = span.text
-                src_tags = [t.pos_ for t in span]
-                src_rank = span._.rank
-                src_label = span.label_
-                src_frequency = span._.frequency
-                src_cluster = span._.cluster
-                tgt_term = ''
-                tgt_rank = 0
-                tgt_tags = ['']
-                frequency = 0
-                similarity = 0
-                biterm_rank = 0
-                origin = ''
-                biterm = BiTerm(src_term, src_tags, src_rank,
-                                src_label, src_frequency, src_cluster,
-                                tgt_term, tgt_tags, tgt_rank,
-                                similarity, frequency, biterm_rank, origin)
-                biterms_strings_dict[(src_term, tgt_term)] = (span, tgt_term)
-                biterms.append(biterm)
-        return ((biterms, biterms_strings_dict))
+        unmatched = np.ones(len(src_table), dtype=bool)
+        unmatched[src_idx] = False
+        unmatched_idx = np.flatnonzero(unmatched)
+        n = len(unmatched_idx)
+        unmatched_biterms = {'src_terms': src_table.texts[unmatched_idx],
+                             'src_lemmas': src_table.lemmas[unmatched_idx],
+                             'src_labels': src_table.labels[unmatched_idx],
+                             'src_frequencies': src_table.frequencies[unmatched_idx],
+                             'src_clusters': src_table.clusters[unmatched_idx],
+                             'tgt_terms': np.full(n, '', dtype=object),
+                             'similarities': np.zeros(n),
+                             'frequencies': np.zeros(n, dtype=int),
+                             'ranks': np.zeros(n),
+                             'origins': np.full(n, '', dtype=object)}
+        return {column: np.concatenate([biterms[column], unmatched_biterms[column]]) for column in biterms}
 
     @staticmethod
-    def _collapse_biterm_lemmas(biterms, biterms_strings_dict):
-        biterms_ = []
-        seen_src_lemmas = []
+    def _collapse_biterm_lemmas(biterms):
         # Sort biterms by rank
-        for biterm in sorted(biterms, key=lambda biterm: biterm.biterm_rank, reverse=True):
-            # Retrieve the source term (as spaCy Span, so that we can check its lemma and label.)
-            src_span = biterms_strings_dict[(
-                biterm.src_term, biterm.tgt_term)][0]
-            # If the lower-cased lemmatized source term has not been seen, and is not an entity, keep the biterm
-            if src_span.label_ == '':
-                if src_span.lemma_.lower() not in seen_src_lemmas:
-                    biterms_.append(biterm)
-                seen_src_lemmas.append(src_span.lemma_.lower())
-            else:
-                biterms_.append(biterm)
-        if len(biterms_) == 0:
+        order = np.argsort(-biterms['ranks'], kind='stable')
+        # Keep entities, and the first biterm of each lower-cased source lemma
+        keep = biterms['src_labels'][order] != ''
+        seen_src_lemmas = set()
+        for position, lemma in zip(np.flatnonzero(~keep), biterms['src_lemmas'][order][~keep]):
+            lemma = lemma.lower()
+            if lemma not in seen_src_lemmas:
+                seen_src_lemmas.add(lemma)
+                keep[position] = True
+        if not keep.any():
             raise ValueError('No biterms found.')
-        return biterms_
+        order = order[keep]
+        return {column: values[order] for column, values in biterms.items()}
 
     def _mt_unmatched_terms(self, biterms):
         # MT API config
@@ -283,36 +315,35 @@ class BitermExtractor:
                    'X-ClientTraceId': str(uuid.uuid4())}
 
         # MT unmatched src terms
-        src_terms_unm = [{'text': biterm.src_term}
-                         for biterm in biterms if biterm.tgt_term == '']
+        unmatched = biterms['tgt_terms'] == ''
+        src_terms_unm = [{'text': src_term} for src_term in biterms['src_terms'][unmatched]]
         if len(src_terms_unm) > 0:
             request = requests.post(
                 constructed_url, params=params, headers=headers, json=src_terms_unm)
             data = request.json()
 
             # Replace empty tgt terms with MT terms
-            tgt_idx = 0
-            for idx, biterm in enumerate(biterms):
-                if biterms[idx].tgt_term == '':
-                    tgt_term_mt = data[tgt_idx]['translations'][0]['text']
-                    biterms[idx] = biterms[idx]._replace(tgt_term=tgt_term_mt)
-                    biterms[idx] = biterms[idx]._replace(origin='MT')
-                    tgt_idx += 1
+            biterms = dict(biterms)
+            biterms['tgt_terms'] = biterms['tgt_terms'].copy()
+            biterms['tgt_terms'][unmatched] = [translation['translations'][0]['text'] for translation in data]
+            biterms['origins'] = biterms['origins'].copy()
+            biterms['origins'][unmatched] = 'MT'
         return biterms
 
+    @staticmethod
+    def _return_as_columns(biterms):
+        """Return biterms as a dict of lists, rounded and sorted by rank like the dataframe."""
+        similarities = np.round(biterms['similarities'].astype(float), 3)
+        ranks = np.round(biterms['ranks'].astype(float), 3)
+        order = np.argsort(-ranks, kind='stable')
+        columns = dict(biterms, similarities=similarities, ranks=ranks)
+        return {column: columns[column][order].tolist() for column in RESPONSE_COLUMNS}
+
     @staticmethod
     def _return_as_df(biterms):
         """Return biterms as pandas dataframe."""
-        biterms = pd.DataFrame(biterms)
-        col_names = ['src_terms', 'src_tags', 'src_ranks',
-                     'src_labels', 'src_frequencies', 'src_clusters',
-                     'tgt_terms', 'tgt_tags', 'tgt_ranks',
-                     'similarities', 'frequencies', 'ranks', 'origins']
-        biterms.columns = col_names
-        biterms.reset_index(drop=True, inplace=True)
+        biterms = pd.DataFrame({column: biterms[column] for column in RESPONSE_COLUMNS})
         biterms['similarities'] = biterms['similarities'].astype(
             float).round(3)
         biterms['ranks'] = biterms['ranks'].astype(float).round(3)
-        biterms = biterms.drop(
-            columns=['src_ranks', 'src_tags', 'tgt_ranks', 'tgt_tags'])
         return biterms.sort_values(by='ranks', ascending=False)
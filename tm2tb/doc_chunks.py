@@ -0,0 +1,87 @@
+"""
+Sentence chunks of the documents, for the document embedding.
+
+A transcript is far longer than the maximum sequence length of the sentence
+transformer, which would only see its first tokens. Such docs are instead cut
+into chunks of whole sentences, and their embedding is the mean of the chunk
+embeddings weighted by their number of tokens. Docs that the model encodes
+whole are a single chunk. Each doc weighs the same in the mean doc embedding.
+Very long docs are sampled.
+
+Functions:
+    sentence_chunks(spacy.tokens.doc.Doc, int)
+    sample_chunks(List[tuple], int)
+"""
+import os
+import numpy as np
+from spacy.pipeline import Sentencizer
+
+DOC_CHUNK_TOKENS = int(os.environ.get("TM2TB_DOC_CHUNK_TOKENS", 128))
+DOC_CHUNKS_MAX = int(os.environ.get("TM2TB_DOC_CHUNKS_MAX", 256))
+
+# Sentence boundaries from punctuation, for docs parsed without the parser
+_sentencizer = Sentencizer()
+
+
+def _doc_chunks(doc, chunk_tokens):
+    """Yield consecutive sentences of up to chunk_tokens tokens, cutting longer sentences in windows."""
+    if not doc.has_annotation("SENT_START"):
+        doc = _sentencizer(doc)
+    start = end = 0
+    for sent in doc.sents:
+        for window_start in range(sent.start, sent.end, chunk_tokens):
+            window_end = min(sent.end, window_start + chunk_tokens)
+            if window_end - start > chunk_tokens and end > start:
+                yield doc[start:end]
+                start = window_start
+            end = window_end
+    if end > start:
+        yield doc[start:end]
+
+
+def sentence_chunks(doc, chunk_tokens=DOC_CHUNK_TOKENS):
+    """
+    Cut a doc into sentence chunks.
+
+    Parameters
+    ----------
+    doc : spacy.tokens.doc.Doc
+        Parsed text.
+    chunk_tokens : int, optional
+        Maximum number of tokens of a chunk. The default is TM2TB_DOC_CHUNK_TOKENS.
+
+    Returns
+    -------
+    chunks : List[tuple]
+        Text and number of tokens of each chunk.
+    """
+    return [(chunk.text, len(chunk)) for chunk in _doc_chunks(doc, chunk_tokens)]
+
+
+def sample_chunks(chunks, chunks_max=DOC_CHUNKS_MAX):
+    """
+    Keep up to chunks_max evenly spaced chunks, so that the sample covers the whole docs.
+
+    Parameters
+    ----------
+    chunks : List[tuple]
+        Doc index, text and number of tokens of each chunk, see sentence_chunks.
+    chunks_max : int, optional
+        Maximum number of chunks. The default is TM2TB_DOC_CHUNKS_MAX.
+
+    Returns
+    -------
+    texts : List[str]
+        Text of each kept chunk.
+    weights : numpy.ndarray
+        Share of each kept chunk in the tokens of its doc.
+    """
+    if len(chunks) == 0:
+        return [''], np.ones(1)
+    doc_tokens = {}
+    for doc_id, _, n_tokens in chunks:
+        doc_tokens[doc_id] = doc_tokens.get(doc_id, 0) + n_tokens
+    if len(chunks) > chunks_max:
+        chunks = [chunks[i] for i in np.linspace(0, len(chunks) - 1, chunks_max).round().astype(int)]
+    return ([text for _, text, _ in chunks],
+            np.array([n_tokens / max(doc_tokens[doc_id], 1) for doc_id, _, n_tokens in chunks]))
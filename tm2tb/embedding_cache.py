@@ -0,0 +1,199 @@
+"""
+Cross-request embedding cache.
+
+Term candidates such as "agile product development" come back request after
+request for the same meeting. Caching their embeddings avoids running the
+transformer model again for texts that have already been encoded.
+
+Classes:
+    EmbeddingCache
+    CachedEncoder
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+
+EMBEDDING_CACHE_ENTRIES = int(os.environ.get("TM2TB_EMBEDDING_CACHE_ENTRIES", 50000))
+EMBEDDING_CACHE_MB = int(os.environ.get("TM2TB_EMBEDDING_CACHE_MB", 256))
+
+
+class EmbeddingCache:
+    """
+    Bounded, thread-safe LRU cache of sentence embeddings.
+
+    Entries are keyed by (model name, text). The least recently used entries are
+    evicted when either the number of entries or the total size in bytes exceeds
+    its budget.
+
+    Attributes
+    ----------
+    max_entries : int
+        Maximum number of cached embeddings. If 0, nothing is cached.
+    max_bytes : int
+        Maximum total size of the cached embeddings and their keys.
+    hits : int
+        Number of lookups that found a cached embedding.
+    misses : int
+        Number of lookups that did not find a cached embedding.
+    evictions : int
+        Number of entries evicted to stay within budget.
+    """
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_ENTRIES, max_bytes=EMBEDDING_CACHE_MB * 1024**2):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _entry_size(key, embedding):
+        return embedding.nbytes + sys.getsizeof(key[1])
+
+    def get(self, key):
+        """Return the cached embedding for key, or None."""
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, key, embedding):
+        """Store an embedding, evicting the least recently used entries if needed."""
+        size = self._entry_size(key, embedding)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        embedding = np.array(embedding, copy=True)
+        embedding.setflags(write=False)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= self._entry_size(key, previous)
+            self._entries[key] = embedding
+            self.nbytes += size
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                old_key, old_embedding = self._entries.popitem(last=False)
+                self.nbytes -= self._entry_size(old_key, old_embedding)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Return the cache counters as a dict."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self._entries),
+                    'bytes': self.nbytes,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0}
+
+
+class CachedEncoder:
+    """
+    Wrap a sentence-transformer model with an embedding cache.
+
+    It has the same `.encode()` contract as the wrapped model. Cached texts are
+    looked up first and only the misses are encoded, in a single batch. Only the
+    texts marked as persistent (the terms, not the documents) are looked up in
+    and written to the store.
+
+    Attributes
+    ----------
+    model : SentenceTransformer
+        The wrapped model.
+    model_name : str
+        Name of the model, used in the cache keys.
+    cache : EmbeddingCache
+        The embedding cache.
+    store : EmbeddingStore, optional
+        Persistent embedding store, checked after the cache and before the model.
+    """
+
+    # encode() arguments that do not change the returned embeddings.
+    cacheable_kwargs = {'batch_size', 'show_progress_bar'}
+
+    def __init__(self, model, model_name, cache=None, store=None):
+        self.model = model
+        self.model_name = model_name
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.store = store
+
+    def __getattr__(self, name):
+        # Delegate everything else (tokenizer, max_seq_length...) to the wrapped model.
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def encode(self, sentences, persist=False, **kwargs):
+        """
+        Encode one or more sentences, reusing cached embeddings.
+
+        Parameters
+        ----------
+        sentences : Union[str, List[str]]
+            Sentence or list of sentences to encode.
+        persist : Union[bool, List[bool]], optional
+            Whether the embeddings are kept in the store, for all the sentences
+            or for each one. The default is False.
+        **kwargs : dict
+            Passed to the wrapped model's encode method.
+
+        Returns
+        -------
+        embeddings : numpy.ndarray
+            One embedding per sentence, in the same order as the input.
+        """
+        if not set(kwargs) <= self.cacheable_kwargs:
+            return self.model.encode(sentences, **kwargs)
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if len(texts) == 0:
+            return self.model.encode(texts, **kwargs)
+
+        persisted = set(texts) if persist is True else {text for text, keep in zip(texts, persist or []) if keep}
+
+        embeddings = [self.cache.get((self.model_name, text)) for text in texts]
+        # Look up each missing text once, even if it is repeated in the input
+        misses = list(dict.fromkeys(text for text, emb in zip(texts, embeddings) if emb is None))
+        if len(misses) > 0:
+            new_embeddings = {}
+            if self.store is not None:
+                stored = [text for text in misses if text in persisted]
+                for text, embedding in zip(stored, self.store.get_many(stored)):
+                    if embedding is not None:
+                        new_embeddings[text] = embedding
+                        self.cache.put((self.model_name, text), embedding)
+                misses = [text for text in misses if text not in new_embeddings]
+            if len(misses) > 0:
+                encoded = self.model.encode(misses, **kwargs)
+                for text, embedding in zip(misses, encoded):
+                    new_embeddings[text] = embedding
+                    self.cache.put((self.model_name, text), embedding)
+                if self.store is not None:
+                    stored = [i for i, text in enumerate(misses) if text in persisted]
+                    if len(stored) > 0:
+                        self.store.put_many([misses[i] for i in stored], [encoded[i] for i in stored])
+            embeddings = [new_embeddings[text] if emb is None else emb
+                          for text, emb in zip(texts, embeddings)]
+        embeddings = np.vstack(embeddings)
+        return embeddings[0] if single else embeddings
@@ -0,0 +1,203 @@
+"""
+Persistent, memory-mapped embedding store.
+
+Term embeddings are appended to a matrix file that is opened with numpy.memmap.
+The row of each text is kept in a SQLite index, which is queried for the texts
+of each request instead of being loaded by every worker. All the workers on a
+node can share the same store: the mapped pages and the index pages live in the
+OS page cache, and the store survives restarts.
+
+The store is bounded: rows are written in two generations of up to half of
+TM2TB_EMBEDDING_STORE_MAX_ROWS rows each. When the current generation is full,
+the previous one is deleted and a new one is started, so the store keeps the
+most recently stored embeddings.
+
+Classes:
+    EmbeddingStore
+"""
+import os
+import sqlite3
+import threading
+import numpy as np
+from tm2tb.file_lock import file_lock
+
+EMBEDDING_STORE_PATH = os.environ.get("TM2TB_EMBEDDING_STORE")
+EMBEDDING_STORE_DTYPE = os.environ.get("TM2TB_EMBEDDING_STORE_DTYPE", "float32")
+EMBEDDING_STORE_MAX_ROWS = int(os.environ.get("TM2TB_EMBEDDING_STORE_MAX_ROWS", 500000))
+
+# Maximum number of texts looked up in one query (SQLite limits the query parameters)
+_QUERY_TEXTS_MAX = 500
+
+
+class EmbeddingStore:
+    """
+    Bounded, disk-backed store of embeddings for one model.
+
+    Files
+    -----
+    {model_name}.{generation}.vectors : raw float16/float32 matrix, one row per text.
+    {model_name}.sqlite : row and generation of each text, embedding dimension and dtype.
+    {model_name}.lock : lock file serializing writers across processes.
+
+    Rows are always written before they are indexed, so any row referenced by
+    the index exists in its matrix file.
+
+    Attributes
+    ----------
+    max_rows : int
+        Maximum number of stored embeddings, over both generations.
+    """
+
+    def __init__(self, path, model_name, dtype=EMBEDDING_STORE_DTYPE, max_rows=EMBEDDING_STORE_MAX_ROWS):
+        if dtype not in ('float16', 'float32'):
+            raise ValueError(f"Unsupported embedding store dtype: {dtype}")
+        self.path = path
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.max_rows = max_rows
+        self.dim = None
+        self.index_path = os.path.join(path, f'{model_name}.sqlite')
+        self.lock_path = os.path.join(path, f'{model_name}.lock')
+        self._connection = None
+        self._pid = None
+        self._vectors = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        with self._lock, self._file_lock():
+            self._create_index()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM rows').fetchone()[0]
+
+    @property
+    def _db(self):
+        # One connection per process: connections must not be shared with forked workers.
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.index_path, timeout=30, check_same_thread=False,
+                                               isolation_level=None)
+            self._pid = os.getpid()
+            self._vectors = {}
+        return self._connection
+
+    def _create_index(self):
+        db = self._db
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('CREATE TABLE IF NOT EXISTS rows '
+                   '(text TEXT PRIMARY KEY, generation INTEGER, row INTEGER)')
+        db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)')
+        dtype = self._meta('dtype')
+        if dtype is not None and dtype != self.dtype.name:
+            raise ValueError(f"Embedding store {self.index_path} uses {dtype}, not {self.dtype.name}.")
+        self.dim = self._meta('dim')
+
+    def _meta(self, key, default=None):
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def _set_meta(self, key, value):
+        self._db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, value))
+
+    def _file_lock(self):
+        # Serialize writers across processes.
+        return file_lock(self.lock_path)
+
+    def _vectors_path(self, generation):
+        return os.path.join(self.path, f'{self.model_name}.{generation}.vectors')
+
+    def _mapped_vectors(self, generation, n_rows):
+        # Remap when the file has grown past the mapped rows
+        vectors = self._vectors.get(generation)
+        if vectors is None or vectors.shape[0] < n_rows:
+            path = self._vectors_path(generation)
+            n_rows = os.path.getsize(path) // (self.dim * self.dtype.itemsize)
+            vectors = np.memmap(path, dtype=self.dtype, mode='r', shape=(n_rows, self.dim))
+            self._vectors = {g: v for g, v in self._vectors.items() if g >= generation - 1}
+            self._vectors[generation] = vectors
+        return vectors
+
+    def _lookup(self, texts):
+        rows = {}
+        for start in range(0, len(texts), _QUERY_TEXTS_MAX):
+            batch = texts[start:start + _QUERY_TEXTS_MAX]
+            query = f"SELECT text, generation, row FROM rows WHERE text IN ({','.join('?' * len(batch))})"
+            for text, generation, row in self._db.execute(query, batch):
+                rows[text] = (generation, row)
+        return rows
+
+    def get_many(self, texts):
+        """
+        Look up the embeddings of several texts.
+
+        Returns
+        -------
+        embeddings : list
+            One float32 array per text, or None if the text is not in the store.
+        """
+        texts = list(texts)
+        with self._lock:
+            rows = self._lookup(texts)
+            if self.dim is None and len(rows) > 0:
+                self.dim = self._meta('dim')
+            embeddings = []
+            for text in texts:
+                generation, row = rows.get(text, (None, None))
+                try:
+                    vectors = None if row is None else self._mapped_vectors(generation, row + 1)
+                except FileNotFoundError:
+                    # The generation was deleted after the lookup
+                    vectors = None
+                embeddings.append(None if vectors is None else np.array(vectors[row], dtype=np.float32))
+            return embeddings
+
+    def put_many(self, texts, embeddings):
+        """Append the embeddings of the texts that are not in the store yet."""
+        with self._lock, self._file_lock():
+            db = self._db
+            stored = self._lookup(list(texts))
+            new = {}
+            for text, embedding in zip(texts, embeddings):
+                if text not in stored:
+                    new[text] = embedding
+            if len(new) == 0:
+                return
+            matrix = np.asarray(list(new.values()), dtype=self.dtype)
+            if self.dim is None:
+                self.dim = self._meta('dim', matrix.shape[1])
+            if matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match "
+                                 f"the store dimension {self.dim}.")
+            generation_rows = max(1, self.max_rows // 2)
+            matrix, new_texts = matrix[:generation_rows], list(new)[:generation_rows]
+            generation = self._meta('generation', 0)
+            n_rows = self._meta('n_rows', 0)
+            if n_rows + len(new_texts) > generation_rows:
+                generation, n_rows = self._rotate(generation)
+            # Drop rows left behind by a writer that died before updating the index
+            vectors_path = self._vectors_path(generation)
+            row_nbytes = self.dim * self.dtype.itemsize
+            if os.path.exists(vectors_path) and os.path.getsize(vectors_path) > n_rows * row_nbytes:
+                os.truncate(vectors_path, n_rows * row_nbytes)
+            with open(vectors_path, 'ab') as fw:
+                fw.write(matrix.tobytes())
+            db.execute('BEGIN IMMEDIATE')
+            db.executemany('INSERT OR REPLACE INTO rows VALUES (?, ?, ?)',
+                           [(text, generation, n_rows + i) for i, text in enumerate(new_texts)])
+            self._set_meta('dim', self.dim)
+            self._set_meta('dtype', self.dtype.name)
+            self._set_meta('generation', generation)
+            self._set_meta('n_rows', n_rows + len(new_texts))
+            db.execute('COMMIT')
+
+    def _rotate(self, generation):
+        """Delete the previous generation and start a new one. Returns the new generation and its size."""
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        db.execute('DELETE FROM rows WHERE generation < ?', (generation,))
+        self._set_meta('generation', generation + 1)
+        self._set_meta('n_rows', 0)
+        db.execute('COMMIT')
+        # Processes that still map the deleted file keep reading it until they remap
+        if os.path.exists(self._vectors_path(generation - 1)):
+            os.remove(self._vectors_path(generation - 1))
+        return generation + 1, 0
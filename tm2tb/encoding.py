@@ -0,0 +1,66 @@
+"""
+Batched encoding of the texts needed by one extraction request.
+
+Functions:
+    encode_texts(List[str], List[bool])
+    fits_max_seq_length(str, int)
+"""
+from typing import List, Optional
+import numpy as np
+from tm2tb import trf_model
+
+
+def encode_texts(texts: List[str], persist: Optional[List[bool]] = None):
+    """
+    Encode several groups of texts with a single call to the transformer model.
+
+    The texts are de-duplicated and sorted by length, so that similarly sized
+    texts are padded together, encoded once and scattered back to their
+    original positions.
+
+    Parameters
+    ----------
+    texts : List[str]
+        Texts to encode (e.g. documents and span candidates).
+    persist : List[bool], optional
+        Whether the embedding of each text is kept in the embedding store.
+        The default is None, which keeps none of them.
+
+    Returns
+    -------
+    embeddings : numpy.ndarray
+        One embedding per text, in the same order as the input.
+    """
+    unique_texts, inverse = np.unique(np.array(texts, dtype=object), return_inverse=True)
+    order = sorted(range(len(unique_texts)),
+                   key=lambda i: (len(unique_texts[i].split()), len(unique_texts[i])))
+    unique_persist = np.zeros(len(unique_texts), dtype=bool)
+    if persist is not None:
+        np.logical_or.at(unique_persist, inverse.reshape(-1), np.asarray(persist, dtype=bool))
+    embeddings = trf_model.encode([unique_texts[i] for i in order],
+                                  persist=[bool(unique_persist[i]) for i in order])
+    unique_embeddings = np.empty_like(embeddings)
+    unique_embeddings[order] = embeddings
+    return unique_embeddings[inverse.reshape(-1)]
+
+
+def fits_max_seq_length(text: str, n_tokens: int):
+    """
+    Whether the transformer model encodes a whole text, without truncating it.
+
+    Parameters
+    ----------
+    text : str
+        Text to encode.
+    n_tokens : int
+        Number of spaCy tokens of the text. The model splits texts in at least as
+        many tokens, so longer texts are not tokenized again.
+
+    Returns
+    -------
+    fits : bool
+    """
+    max_seq_length = trf_model.max_seq_length
+    if n_tokens > max_seq_length:
+        return False
+    return len(trf_model.tokenizer(text)['input_ids']) <= max_seq_length
@@ -0,0 +1,179 @@
+"""
+Cross-request micro-batching of transformer encoding.
+
+When several requests are processed concurrently, each one encodes its own
+small batch of texts. The scheduler coalesces the texts of concurrent encode
+calls into one batch, flushed when it reaches a maximum size or when the oldest
+call has waited a few milliseconds, and routes the embeddings back to each caller.
+
+Classes:
+    EncodingScheduler
+"""
+import os
+import time
+import weakref
+import threading
+from collections import deque
+import numpy as np
+
+ENCODING_BATCH_WAIT_MS = float(os.environ.get("TM2TB_ENCODING_BATCH_WAIT_MS", 0))
+ENCODING_BATCH_SIZE = int(os.environ.get("TM2TB_ENCODING_BATCH_SIZE", 128))
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+QUEUE_WAIT_MS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class _EncodeCall:
+    """Texts of one encode call, waiting for their embeddings."""
+    def __init__(self, texts):
+        self.texts = texts
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.embeddings = None
+        self.error = None
+
+
+def _histogram(buckets):
+    return {**{f'le_{bucket}': 0 for bucket in buckets}, 'inf': 0}
+
+
+def _observe(histogram, buckets, value):
+    for bucket in buckets:
+        if value <= bucket:
+            histogram[f'le_{bucket}'] += 1
+            return
+    histogram['inf'] += 1
+
+
+class EncodingScheduler:
+    """
+    Coalesce encode calls from concurrent threads into shared batches.
+
+    It has the same `.encode()` contract as the wrapped model.
+
+    Attributes
+    ----------
+    model : SentenceTransformer
+        The wrapped model.
+    max_batch_size : int
+        Number of texts that triggers a flush. Calls are never split, so a batch
+        can be larger if a single call is.
+    max_wait_ms : float
+        Maximum time the oldest call waits for other calls to join its batch.
+    """
+
+    def __init__(self, model, max_batch_size=ENCODING_BATCH_SIZE, max_wait_ms=ENCODING_BATCH_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._reset()
+        # Forked processes inherit neither the flushing thread nor the waiting calls,
+        # and their locks may have been held by another thread: reset them in the
+        # child, before any of its threads can use them
+        scheduler = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: scheduler() and scheduler()._reset())
+
+    def _reset(self):
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.calls = 0
+        self.texts = 0
+        self.queue_wait_ms_total = 0.0
+        self.batch_size_histogram = _histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_ms_histogram = _histogram(QUEUE_WAIT_MS_BUCKETS)
+
+    def __getattr__(self, name):
+        if name == 'model':
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def _ensure_thread(self):
+        # Called with the condition held
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='encoding-scheduler', daemon=True)
+            self._thread.start()
+
+    def encode(self, sentences, **kwargs):
+        """
+        Encode one or more sentences in a batch shared with concurrent calls.
+
+        Calls with arguments other than batch_size/show_progress_bar are passed
+        straight to the model.
+        """
+        if not set(kwargs) <= {'batch_size', 'show_progress_bar'}:
+            return self.model.encode(sentences, **kwargs)
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if len(texts) == 0:
+            return self.model.encode(texts)
+        call = _EncodeCall(texts)
+        with self._condition:
+            self._ensure_thread()
+            self._queue.append(call)
+            self._condition.notify()
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.embeddings[0] if single else call.embeddings
+
+    def _next_batch(self):
+        with self._condition:
+            while len(self._queue) == 0:
+                self._condition.wait()
+            # Wait for more calls until the batch is full or the oldest call's deadline
+            deadline = self._queue[0].enqueued_at + self.max_wait_ms / 1000
+            while sum(len(call.texts) for call in self._queue) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = [self._queue.popleft()]
+            size = len(batch[0].texts)
+            while len(self._queue) > 0 and size + len(self._queue[0].texts) <= self.max_batch_size:
+                call = self._queue.popleft()
+                batch.append(call)
+                size += len(call.texts)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._record(batch, time.perf_counter())
+                embeddings = self.model.encode([text for call in batch for text in call.texts])
+                offsets = np.cumsum([len(call.texts) for call in batch])[:-1]
+                for call, call_embeddings in zip(batch, np.split(embeddings, offsets)):
+                    call.embeddings = call_embeddings
+            except BaseException as error:
+                # Also SystemExit and the like: the callers must never wait forever
+                for call in batch:
+                    call.error = error
+            finally:
+                for call in batch:
+                    call.done.set()
+
+    def _record(self, batch, flushed_at):
+        with self._stats_lock:
+            size = sum(len(call.texts) for call in batch)
+            self.batches += 1
+            self.calls += len(batch)
+            self.texts += size
+            _observe(self.batch_size_histogram, BATCH_SIZE_BUCKETS, size)
+            for call in batch:
+                wait_ms = (flushed_at - call.enqueued_at) * 1000
+                self.queue_wait_ms_total += wait_ms
+                _observe(self.queue_wait_ms_histogram, QUEUE_WAIT_MS_BUCKETS, wait_ms)
+
+    def stats(self):
+        """Return the batch size and queue wait time histograms."""
+        with self._stats_lock:
+            return {'batches': self.batches,
+                    'calls': self.calls,
+                    'texts': self.texts,
+                    'mean_batch_size': round(self.texts / self.batches, 2) if self.batches else 0.0,
+                    'mean_queue_wait_ms': round(self.queue_wait_ms_total / self.calls, 3) if self.calls else 0.0,
+                    'batch_size_histogram': dict(self.batch_size_histogram),
+                    'queue_wait_ms_histogram': dict(self.queue_wait_ms_histogram)}
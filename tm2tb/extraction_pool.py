@@ -0,0 +1,233 @@
+"""
+Process pool of term extraction workers.
+
+Each worker process loads the sentence transformer model and the spaCy models
+once, when it starts, and then runs extraction tasks sent by the API processes.
+Workers are recycled after a number of tasks to cap their memory growth, and
+when one of their tasks times out. A task whose worker dies fails right away.
+
+Classes:
+    ExtractionPool
+    WorkerCrashedError
+
+Functions:
+    default_pool_size(int, int)
+    extract_biterms(List[tuple], str, str, dict)
+    extract_terms(List[str], str, dict)
+"""
+import os
+import time
+import signal
+import itertools
+import threading
+import multiprocessing
+
+
+
+def default_pool_size(http_workers, cpus=None):
+    """
+    Number of extraction workers of each HTTP worker process, so that the pools
+    of all the HTTP workers of a host add up to its number of CPUs (at least 1).
+    """
+    return max(1, (cpus or os.cpu_count() or 1) // max(1, http_workers))
+
+
+# HTTP worker processes on this host, each with its own extraction pool
+# (uvicorn --workers and server.py --workers default to WEB_CONCURRENCY)
+HTTP_WORKERS = int(os.environ.get("WEB_CONCURRENCY", 1))
+EXTRACTION_POOL_SIZE = int(os.environ.get("TM2TB_EXTRACTION_POOL_SIZE", default_pool_size(HTTP_WORKERS)))
+EXTRACTION_POOL_TIMEOUT = float(os.environ.get("TM2TB_EXTRACTION_POOL_TIMEOUT", 300))
+EXTRACTION_POOL_MAX_TASKS = int(os.environ.get("TM2TB_EXTRACTION_POOL_MAX_TASKS", 200))
+EXTRACTION_POOL_PRELOAD = [lang.strip() for lang in os.environ.get("TM2TB_EXTRACTION_POOL_PRELOAD", "").split(",")
+                           if lang.strip()]
+EXTRACTION_POOL_START_METHOD = os.environ.get("TM2TB_EXTRACTION_POOL_START_METHOD", "spawn")
+
+# Seconds between two checks that the worker running a task is still alive
+_WORKER_POLL_SECONDS = 1.0
+
+# Queue on which a worker reports the tasks it starts, set by _init_worker
+_task_starts = None
+
+
+class WorkerCrashedError(RuntimeError):
+    """The worker process running a task died before returning its result."""
+
+
+def _init_worker(preload_langs, task_starts):
+    """Load the models once per worker process."""
+    global _task_starts
+    _task_starts = task_starts
+    from tm2tb import trf_model, spacy_registry, preload_language_resources, log_startup_timings
+    trf_model.model.preload()
+    spacy_registry.preload(preload_langs)
+    preload_language_resources(preload_langs)
+    log_startup_timings()
+
+
+def _run_task(task_id, deadline, func, args):
+    """Report which worker runs the task, then run it, unless it timed out while queued."""
+    if time.time() > deadline:
+        raise TimeoutError("Extraction task timed out in the queue.")
+    _task_starts.put((task_id, os.getpid()))
+    return func(*args)
+
+
+def extract_biterms(bitext, src_lang, tgt_lang, kwargs):
+    """Worker task: extract biterms with BitermExtractor."""
+    from tm2tb import BitermExtractor
+    extractor = BitermExtractor(bitext, src_lang=src_lang, tgt_lang=tgt_lang)
+    return extractor.extract_terms(**kwargs)
+
+
+def extract_terms(texts, lang, kwargs):
+    """
+    Worker task: extract terms with TermExtractor.
+
+    Spans cannot be sent back cheaply (pickling a span pickles its vocab), so the
+    terms are returned as a list of dicts.
+    """
+    from tm2tb import TermExtractor
+    return TermExtractor(texts, lang=lang).extract_terms(return_table=True, **kwargs).to_dicts()
+
+
+class ExtractionPool:
+    """
+    Pool of extraction worker processes.
+
+    Attributes
+    ----------
+    processes : int
+        Number of worker processes.
+    timeout : float
+        Seconds to wait for the result of a task.
+    max_tasks_per_child : int
+        Number of tasks after which a worker process is replaced by a new one.
+    preload_langs : List[str]
+        Languages whose spaCy models are loaded when a worker starts.
+    """
+
+    def __init__(self, processes=EXTRACTION_POOL_SIZE,
+                 timeout=EXTRACTION_POOL_TIMEOUT,
+                 max_tasks_per_child=EXTRACTION_POOL_MAX_TASKS,
+                 preload_langs=EXTRACTION_POOL_PRELOAD,
+                 start_method=EXTRACTION_POOL_START_METHOD):
+        self.processes = processes
+        self.timeout = timeout
+        self.max_tasks_per_child = max_tasks_per_child
+        self.preload_langs = preload_langs
+        self.start_method = start_method
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.crashes = 0
+        self.in_flight = 0
+        self._pool = None
+        self._task_starts = None
+        self._task_workers = {}
+        self._task_ids = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        # Started on first use, so that the API process does not load any model.
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    context = multiprocessing.get_context(self.start_method)
+                    self._task_starts = context.SimpleQueue()
+                    self._pool = context.Pool(self.processes,
+                                              initializer=_init_worker,
+                                              initargs=(self.preload_langs, self._task_starts),
+                                              maxtasksperchild=self.max_tasks_per_child or None)
+        return self._pool
+
+    def _finish(self, task, counter):
+        # Count each task once: when its result arrives or when it times out.
+        with self._lock:
+            if task['finished']:
+                return
+            task['finished'] = True
+            self.in_flight -= 1
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _task_worker(self, task_id):
+        # Process id of the worker running the task, or None if it has not started yet
+        with self._lock:
+            while not self._task_starts.empty():
+                started_id, pid = self._task_starts.get()
+                self._task_workers[started_id] = pid
+            return self._task_workers.get(task_id)
+
+    @staticmethod
+    def _is_alive(pid):
+        return pid in {process.pid for process in multiprocessing.active_children()}
+
+    def run(self, func, *args):
+        """
+        Run func(*args) in a worker process and wait for its result.
+
+        Raises
+        ------
+        TimeoutError
+            If the result is not ready after `timeout` seconds. The worker running
+            the task is killed and replaced by the pool, and a task still queued
+            is skipped when it reaches a worker.
+        WorkerCrashedError
+            If the worker running the task dies.
+        """
+        task = {'finished': False}
+        with self._lock:
+            self.submitted += 1
+            self.in_flight += 1
+            task_id = next(self._task_ids)
+        deadline = time.monotonic() + self.timeout
+        result = self.pool.apply_async(_run_task, (task_id, time.time() + self.timeout, func, args),
+                                       callback=lambda _: self._finish(task, 'completed'),
+                                       error_callback=lambda _: self._finish(task, 'failed'))
+        try:
+            while not result.ready():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._finish(task, 'timeouts')
+                    pid = self._task_worker(task_id)
+                    if pid is not None:
+                        try:
+                            os.kill(pid, signal.SIGTERM)
+                        except ProcessLookupError:
+                            pass
+                    raise TimeoutError(f"Extraction task timed out after {self.timeout} seconds.")
+                result.wait(min(remaining, _WORKER_POLL_SECONDS))
+                pid = self._task_worker(task_id)
+                # A worker that exits after a task (max_tasks_per_child) sends its result first
+                if not result.ready() and pid is not None and not self._is_alive(pid):
+                    result.wait(_WORKER_POLL_SECONDS)
+                    if not result.ready():
+                        self._finish(task, 'crashes')
+                        raise WorkerCrashedError("The extraction worker died while running the task.")
+            return result.get()
+        finally:
+            with self._lock:
+                self._task_workers.pop(task_id, None)
+
+    def stats(self):
+        """Return the pool counters and its saturation (busy share of the workers)."""
+        with self._lock:
+            return {'processes': self.processes,
+                    'started': self._pool is not None,
+                    'in_flight': self.in_flight,
+                    'saturation': round(self.in_flight / self.processes, 3),
+                    'submitted': self.submitted,
+                    'completed': self.completed,
+                    'failed': self.failed,
+                    'timeouts': self.timeouts,
+                    'crashes': self.crashes,
+                    'max_tasks_per_child': self.max_tasks_per_child}
+
+    def close(self):
+        """Stop the worker processes."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
@@ -0,0 +1,25 @@
+"""
+Lock files serializing work across processes.
+
+Functions:
+    file_lock(str)
+"""
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on the file at path (created if needed) until the block exits."""
+    with open(path, 'a') as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_UN)
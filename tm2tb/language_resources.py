@@ -0,0 +1,183 @@
+"""
+Per-language term extraction resources.
+
+The POS-pattern matcher and the stopword lists of a language are built once per
+process and shared by every TermExtractor, instead of being rebuilt for each
+request. They are dropped when the spaCy model of the language is unloaded.
+
+Classes:
+    LanguageResources
+
+Functions:
+    get_language_resources(str)
+    preload_language_resources(List[str])
+"""
+import os
+import threading
+from itertools import product
+from spacy.matcher import Matcher
+from tm2tb.spacy_models import registry
+
+noun = {'POS': {'IN': ['NOUN']}, 'IS_PUNCT': False, 'LIKE_NUM': False}
+adj = {'POS': 'ADJ', 'IS_PUNCT': False, 'OP': '*'}
+adp = {'POS': 'ADP', 'IS_PUNCT': False}
+nVj = {'POS': {'IN': ['ADJ', 'NOUN']}, 'OP': '*', 'IS_PUNCT': False, 'LIKE_NUM': False}
+
+noun_final = [[nVj, noun], [nVj, noun, adp, nVj, noun]]
+noun_initial = [[noun, nVj], [noun, nVj, adp, noun, nVj]]
+
+PATTERNS = {
+    'en': noun_final,
+    'de': [[adj, noun], [noun, noun]],
+    'fr': noun_initial,
+    'es': noun_initial,
+    'it': noun_initial,
+    'pt': noun_initial
+    }
+
+WARM_UP_TEXT = 'This is a short text.'
+
+# Pipeline components whose output the term extraction never reads
+UNUSED_PIPES = ('parser',)
+# Pipeline components only needed to extract entities
+ENTITY_PIPES = ('ner',)
+
+# Longer span ranges expand into too many patterns and use the unbounded matcher
+BOUNDED_SPAN_LENGTH_MAX = 12
+BOUNDED_MATCHERS_MAX = 32
+
+
+def bounded_patterns(pattern, span_range):
+    """
+    Expand the OP '*' tokens of a Matcher pattern into fixed repetitions.
+
+    Only the expansions whose length is within span_range are returned, so that
+    the matcher does not generate the candidates that would be filtered out.
+
+    Parameters
+    ----------
+    pattern : List[dict]
+        Matcher pattern.
+    span_range : tuple
+        Minimum and maximum length of the matches, in tokens.
+
+    Returns
+    -------
+    patterns : List[List[dict]]
+        Patterns without repetition operators.
+    """
+    min_len, max_len = span_range
+    repeated = [i for i, token in enumerate(pattern) if token.get('OP') == '*']
+    n_fixed = len(pattern) - len(repeated)
+    patterns = []
+    for counts in product(range(max(max_len - n_fixed, -1) + 1), repeat=len(repeated)):
+        if not min_len <= n_fixed + sum(counts) <= max_len:
+            continue
+        repetitions = dict(zip(repeated, counts))
+        expanded = []
+        for i, token in enumerate(pattern):
+            if i in repetitions:
+                expanded.extend([{key: value for key, value in token.items() if key != 'OP'}] * repetitions[i])
+            else:
+                expanded.append(token)
+        patterns.append(expanded)
+    return patterns
+
+
+def _read_stopwords(lang, kind):
+    path = os.path.join('stopwords', f'{lang}_frequent_{kind}.txt')
+    with open(path, 'r', encoding='utf8') as fr:
+        return frozenset(fr.read().split('\n'))
+
+
+class LanguageResources:
+    """
+    Compiled term extraction resources of a language.
+
+    Attributes
+    ----------
+    lang : str
+        Two-character language identifier.
+    nlp : spacy.language.Language
+        spaCy model of the language.
+    matcher : spacy.matcher.Matcher
+        Matcher of the term POS patterns of the language, of any length.
+    frequent_nouns : frozenset
+        Frequent noun lemmas, which are not considered terms.
+    frequent_adjs : frozenset
+        Frequent adjective lemmas, which are not allowed in terms.
+    """
+
+    def __init__(self, lang, nlp):
+        self.lang = lang
+        self.nlp = nlp
+        self.matcher = Matcher(nlp.vocab)
+        for i, pattern in enumerate(PATTERNS[lang]):
+            self.matcher.add(f"{i}", [pattern])
+        self.frequent_nouns = _read_stopwords(lang, 'nouns')
+        self.frequent_adjs = _read_stopwords(lang, 'adjs')
+        self._bounded_matchers = {}
+        self._lock = threading.Lock()
+
+    def bounded_matcher(self, span_range):
+        """
+        Return a matcher of the term POS patterns limited to a length range.
+
+        Matchers are compiled once per span range.
+        """
+        span_range = tuple(span_range)
+        if span_range[1] > BOUNDED_SPAN_LENGTH_MAX:
+            return self.matcher
+        with self._lock:
+            matcher = self._bounded_matchers.get(span_range)
+            if matcher is None:
+                if len(self._bounded_matchers) >= BOUNDED_MATCHERS_MAX:
+                    self._bounded_matchers.clear()
+                matcher = Matcher(self.nlp.vocab)
+                for i, pattern in enumerate(PATTERNS[self.lang]):
+                    patterns = bounded_patterns(pattern, span_range)
+                    if patterns:
+                        matcher.add(f"{i}", patterns)
+                self._bounded_matchers[span_range] = matcher
+            return matcher
+
+    def disabled_pipes(self, include_entities=False):
+        """Names of the pipeline components that a request does not need."""
+        unused = UNUSED_PIPES if include_entities else UNUSED_PIPES + ENTITY_PIPES
+        return [name for name in self.nlp.pipe_names if name in unused]
+
+    def warm_up(self):
+        """Run the pipeline and the matcher once, so that their lazily loaded data is ready."""
+        self.matcher(self.nlp(WARM_UP_TEXT))
+
+
+_resources = {}
+_lock = threading.Lock()
+
+
+def get_language_resources(lang):
+    """Return the resources of a language, building them on first use."""
+    # Get the model first: the registry may unload (and drop the resources of)
+    # another language, which must not happen while _lock is held.
+    nlp = registry.get(lang)
+    with _lock:
+        resources = _resources.get(lang)
+        if resources is None or resources.nlp is not nlp:
+            resources = LanguageResources(lang, nlp)
+            _resources[lang] = resources
+        return resources
+
+
+def drop_language_resources(lang):
+    """Forget the resources of a language, so that its model can be freed."""
+    with _lock:
+        _resources.pop(lang, None)
+
+
+def preload_language_resources(langs):
+    """Build and warm up the resources of several languages, e.g. at startup."""
+    for lang in langs:
+        get_language_resources(lang).warm_up()
+
+
+registry.on_unload.append(drop_language_resources)
@@ -0,0 +1,66 @@
+"""
+Thread pools created on first use.
+
+A thread pool created at import time would be copied into the server workers
+forked after the import, without its threads. These pools are created in the
+process that submits the first job.
+
+Classes:
+    LazyThreadPool
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class LazyThreadPool:
+    """
+    ThreadPoolExecutor created on first use.
+
+    Attributes
+    ----------
+    max_workers : int
+        Number of threads of the pool.
+    thread_name_prefix : str
+        Prefix of the thread names.
+    """
+
+    def __init__(self, max_workers, thread_name_prefix):
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._executor = None
+        self._idle = threading.Semaphore(max(max_workers, 0))
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix=self.thread_name_prefix)
+        return self._executor
+
+    def submit(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) in the pool and return its future."""
+        return self.executor.submit(func, *args, **kwargs)
+
+    def try_submit(self, func, *args, **kwargs):
+        """
+        Run func(*args, **kwargs) in an idle thread of the pool.
+
+        Only the jobs submitted with try_submit are counted as busy threads.
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Future of the job, or None if all the threads are busy.
+        """
+        if not self._idle.acquire(blocking=False):
+            return None
+        try:
+            future = self.executor.submit(func, *args, **kwargs)
+        except BaseException:
+            self._idle.release()
+            raise
+        future.add_done_callback(lambda _: self._idle.release())
+        return future
@@ -0,0 +1,155 @@
+"""
+ONNX Runtime backend for sentence-transformer models.
+
+The full sentence-transformer pipeline (transformer, pooling, dense and
+normalization layers) is exported to ONNX and dynamically quantized to int8.
+The resulting encoder has the same `.encode()` contract as SentenceTransformer.
+
+It requires the optional `onnx` and `onnxruntime` packages.
+
+Classes:
+    OnnxSentenceEncoder
+"""
+import os
+import json
+import time
+import numpy as np
+from tm2tb.similarity import normalize_rows
+
+
+class OnnxSentenceEncoder:
+    """
+    Encode sentences with a quantized ONNX export of a sentence-transformer model.
+
+    Attributes
+    ----------
+    model_dir : str
+        Directory containing the quantized model, its tokenizer and config.
+    max_seq_length : int
+        Maximum number of tokens per sentence. Longer sentences are truncated.
+    """
+    model_file = 'model-int8.onnx'
+    config_file = 'onnx_config.json'
+
+    def __init__(self, model_dir):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The onnx backend requires onnxruntime: pip install onnx onnxruntime")
+        from transformers import AutoTokenizer
+        self.model_dir = model_dir
+        with open(os.path.join(model_dir, self.config_file), 'r', encoding='utf8') as fr:
+            config = json.load(fr)
+        self.max_seq_length = config['max_seq_length']
+        self.input_names = config['input_names']
+        start = time.perf_counter()
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        tokenizer_time = time.perf_counter() - start
+        start = time.perf_counter()
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, self.model_file),
+                                                    options, providers=['CPUExecutionProvider'])
+        self.timings = {'tokenizer': round(tokenizer_time, 3),
+                        'weights': round(time.perf_counter() - start, 3)}
+
+    @classmethod
+    def export(cls, model, model_dir):
+        """
+        Export a SentenceTransformer model to ONNX and quantize its weights to int8.
+
+        Parameters
+        ----------
+        model : SentenceTransformer
+            The full-precision model.
+        model_dir : str
+            Output directory.
+        """
+        try:
+            import torch
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+        except ImportError:
+            raise ImportError("The onnx backend requires onnxruntime: pip install onnx onnxruntime")
+
+        class SentenceEmbedding(torch.nn.Module):
+            """Map positional tokenizer outputs to the sentence-transformer features dict."""
+            def __init__(self, model, input_names):
+                super().__init__()
+                self.model = model
+                self.input_names = input_names
+
+            def forward(self, *inputs):
+                features = dict(zip(self.input_names, inputs))
+                return self.model(features)['sentence_embedding']
+
+        os.makedirs(model_dir, exist_ok=True)
+        model.eval()
+        dummy = model.tokenize(['This is a sentence.', 'This is another sentence.'])
+        input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in dummy]
+        fp32_path = os.path.join(model_dir, 'model.onnx')
+        with torch.no_grad():
+            torch.onnx.export(SentenceEmbedding(model, input_names),
+                              tuple(dummy[name] for name in input_names),
+                              fp32_path,
+                              input_names=input_names,
+                              output_names=['sentence_embedding'],
+                              dynamic_axes={**{name: {0: 'batch', 1: 'sequence'} for name in input_names},
+                                            'sentence_embedding': {0: 'batch'}},
+                              opset_version=14)
+        quantize_dynamic(fp32_path, os.path.join(model_dir, cls.model_file), weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+        model.tokenizer.save_pretrained(model_dir)
+        with open(os.path.join(model_dir, cls.config_file), 'w', encoding='utf8') as fw:
+            json.dump({'max_seq_length': model.get_max_seq_length(), 'input_names': input_names}, fw)
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=None, convert_to_numpy=True,
+               convert_to_tensor=False, normalize_embeddings=False):
+        """
+        Encode one or more sentences.
+
+        The other arguments of SentenceTransformer.encode are not supported and
+        raise a TypeError.
+
+        Parameters
+        ----------
+        sentences : Union[str, List[str]]
+            Sentence or list of sentences to encode.
+        batch_size : int, optional
+            Number of sentences per inference call. The default is 32.
+        show_progress_bar : bool, optional
+            Ignored: no progress bar is shown.
+        convert_to_numpy : bool, optional
+            Return a numpy array. If False, return a list of one array per sentence.
+            The default is True.
+        convert_to_tensor : bool, optional
+            Return a torch tensor (requires torch). It overrides convert_to_numpy.
+            The default is False.
+        normalize_embeddings : bool, optional
+            Scale the embeddings to unit length. The default is False.
+
+        Returns
+        -------
+        embeddings : Union[numpy.ndarray, List[numpy.ndarray], torch.Tensor]
+            One embedding per sentence, in the same order as the input.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if len(texts) == 0:
+            return np.asarray([])
+        # Batch sentences of similar length together to reduce padding
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        embeddings = np.empty((len(texts), self.session.get_outputs()[0].shape[1]), dtype=np.float32)
+        for i in range(0, len(texts), batch_size):
+            batch_idx = order[i:i + batch_size]
+            encoded = self.tokenizer([texts[j] for j in batch_idx], padding=True, truncation=True,
+                                     max_length=self.max_seq_length, return_tensors='np')
+            inputs = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            embeddings[batch_idx] = self.session.run(['sentence_embedding'], inputs)[0]
+        if normalize_embeddings:
+            embeddings = normalize_rows(embeddings)
+        if convert_to_tensor:
+            import torch
+            embeddings = torch.from_numpy(embeddings)
+        elif not convert_to_numpy:
+            embeddings = list(embeddings)
+        return embeddings[0] if single else embeddings
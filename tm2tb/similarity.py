@@ -0,0 +1,61 @@
+"""
+Similarity of embedding matrices.
+
+Embeddings are normalized once to unit float32 rows, so that cosine similarities
+are plain matrix products. Products are computed in blocks of rows to bound the
+memory used by large term sets.
+
+Functions:
+    normalize_rows(numpy.ndarray)
+    top_k_matches(numpy.ndarray, numpy.ndarray, int, int)
+"""
+import os
+import numpy as np
+
+SIMILARITY_BLOCK_ROWS = int(os.environ.get("TM2TB_SIMILARITY_BLOCK_ROWS", 1024))
+
+
+def normalize_rows(embeddings):
+    """Return the embeddings as float32 rows of unit norm (zero rows are left as is)."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.where(norms == 0, 1, norms)
+
+
+def top_k_matches(src_embeddings, tgt_embeddings, k=1, block_rows=SIMILARITY_BLOCK_ROWS):
+    """
+    Find the k most similar target rows of each source row.
+
+    Parameters
+    ----------
+    src_embeddings : numpy.ndarray
+        Unit-normalized source embeddings.
+    tgt_embeddings : numpy.ndarray
+        Unit-normalized target embeddings.
+    k : int, optional
+        Number of matches per source row. The default is 1.
+    block_rows : int, optional
+        Number of source rows whose similarities are computed at once.
+
+    Returns
+    -------
+    indices : numpy.ndarray
+        (n_src, k) target indices, from the most to the least similar.
+        With k=1, ties go to the lowest index, as with argmax.
+    similarities : numpy.ndarray
+        (n_src, k) cosine similarities of the matches.
+    """
+    k = min(k, len(tgt_embeddings))
+    indices = np.empty((len(src_embeddings), k), dtype=np.intp)
+    similarities = np.empty((len(src_embeddings), k), dtype=np.float32)
+    for start in range(0, len(src_embeddings), block_rows):
+        block = src_embeddings[start:start + block_rows] @ tgt_embeddings.T
+        if k == 1:
+            top = np.argmax(block, axis=1)[:, None]
+        else:
+            top = np.argpartition(block, -k, axis=1)[:, -k:]
+            order = np.argsort(-np.take_along_axis(block, top, axis=1), axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+        indices[start:start + len(block)] = top
+        similarities[start:start + len(block)] = np.take_along_axis(block, top, axis=1)
+    return indices, similarities
@@ -1,24 +1,163 @@
+import os
+import time
+import threading
+from collections import OrderedDict
 import spacy
 """
 spaCy model selection.
 
-TM2TB comes with 4 spaCy language models (English, Spanish, German and French).
+TM2TB comes with 6 spaCy language models (English, Spanish, German, French, Italian and Portuguese).
 
 In order to support additional languages,
 the corresponding spaCy model must be installed.
 Check the available spaCy language models here: https://spacy.io/models
+
+Models are loaded on first use. A list of languages can be preloaded at startup
+(TM2TB_SPACY_PRELOAD, e.g. "en,fr"), and the least recently used models are
+unloaded when the loaded models exceed a memory budget (TM2TB_SPACY_MEMORY_BUDGET_MB).
 """
 
 # Disable unneeded pipeline components
 disabled_comps = ['entity_linker', 'trf_data', 'textcat']
-print('Loading spacy models...')
 
-models = {'en': spacy.load("en_core_web_md", exclude=disabled_comps),
-          'de': spacy.load("de_core_news_md", exclude=disabled_comps),
-          'es': spacy.load("es_core_news_md", exclude=disabled_comps),
-          'fr': spacy.load("fr_core_news_md", exclude=disabled_comps),
-          'it': spacy.load("it_core_news_md", exclude=disabled_comps),
-          'pt': spacy.load("pt_core_news_md", exclude=disabled_comps)}
+model_names = {'en': "en_core_web_md",
+               'de': "de_core_news_md",
+               'es': "es_core_news_md",
+               'fr': "fr_core_news_md",
+               'it': "it_core_news_md",
+               'pt': "pt_core_news_md"}
+
+SPACY_PRELOAD = [lang.strip() for lang in os.environ.get("TM2TB_SPACY_PRELOAD", "").split(",") if lang.strip()]
+SPACY_MEMORY_BUDGET_MB = int(os.environ.get("TM2TB_SPACY_MEMORY_BUDGET_MB", 0))
+
+
+def _resident_memory():
+    """Resident set size of the current process in bytes, or None if unavailable."""
+    try:
+        with open('/proc/self/statm', 'r') as fr:
+            return int(fr.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _disk_size(model_name):
+    """Size in bytes of an installed spaCy model package."""
+    path = spacy.util.get_package_path(model_name)
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+def _load_model(model_name):
+    return spacy.load(model_name, exclude=disabled_comps)
+
+
+class SpacyModelRegistry:
+    """
+    Registry of spaCy language models, loaded on first use.
+
+    Models are loaded one at a time, so that the memory measured for a model
+    does not include the memory of another one being loaded at the same time.
+
+    Attributes
+    ----------
+    model_names : dict
+        Installed spaCy model name of each supported language.
+    memory_budget_mb : int
+        Memory budget of the loaded models in megabytes. If 0, models are never unloaded.
+    loader : Callable
+        Function loading a model from its name.
+    on_unload : List[Callable]
+        Functions called with the language of a model when it is unloaded,
+        to release the objects that keep a reference to it.
+    """
+
+    def __init__(self, model_names, memory_budget_mb=0, loader=_load_model):
+        self.model_names = model_names
+        self.memory_budget_mb = memory_budget_mb
+        self.loader = loader
+        self._models = OrderedDict()
+        self._info = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.on_unload = []
+
+    def get(self, lang):
+        """Return the model of a language, loading it if needed."""
+        if lang not in self.model_names:
+            raise ValueError(f"Model {lang}_core_news_md is not currently supported.")
+        with self._lock:
+            if lang in self._models:
+                self._models.move_to_end(lang)
+                return self._models[lang]
+        # Only one thread loads a model at a time; the others wait for it.
+        with self._load_lock:
+            with self._lock:
+                if lang in self._models:
+                    self._models.move_to_end(lang)
+                    return self._models[lang]
+            model, info = self._load(lang)
+            with self._lock:
+                self._models[lang] = model
+                self._info[lang] = info
+                self._enforce_budget(keep=lang)
+        return model
+
+    def _load(self, lang):
+        model_name = self.model_names[lang]
+        print(f'Loading spacy model {model_name}...')
+        rss_before = _resident_memory()
+        start = time.perf_counter()
+        model = self.loader(model_name)
+        load_time = time.perf_counter() - start
+        rss_after = _resident_memory()
+        if rss_before is not None and rss_after is not None and rss_after > rss_before:
+            memory = rss_after - rss_before
+        else:
+            memory = _disk_size(model_name)
+        return model, {'model': model_name,
+                       'load_time': round(load_time, 3),
+                       'memory_mb': round(memory / 1024**2, 1)}
+
+    def _enforce_budget(self, keep):
+        # Unload the least recently used models until the budget is met
+        if self.memory_budget_mb <= 0:
+            return
+        while sum(self._info[lang]['memory_mb'] for lang in self._models) > self.memory_budget_mb:
+            lru = next((lang for lang in self._models if lang != keep), None)
+            if lru is None:
+                break
+            self._unload(lru)
+
+    def _unload(self, lang):
+        print(f'Unloading spacy model {self.model_names[lang]}...')
+        del self._models[lang]
+        self._info.pop(lang)
+        for callback in self.on_unload:
+            callback(lang)
+
+    def unload(self, lang):
+        """Unload the model of a language, if loaded."""
+        with self._lock:
+            if lang in self._models:
+                self._unload(lang)
+
+    def preload(self, langs):
+        """Load the models of several languages, e.g. at startup."""
+        for lang in langs:
+            self.get(lang)
+
+    def resident_models(self):
+        """Languages of the loaded models, from least to most recently used."""
+        with self._lock:
+            return list(self._models)
+
+    def stats(self):
+        """Return the load time and estimated memory of each loaded model."""
+        with self._lock:
+            return {lang: dict(self._info[lang]) for lang in self._models}
+
+
+registry = SpacyModelRegistry(model_names, memory_budget_mb=SPACY_MEMORY_BUDGET_MB)
 
 
 def get_spacy_model(lang):
@@ -41,8 +180,4 @@ def get_spacy_model(lang):
 
         DESCRIPTION. spaCy language model
     """
-    try:
-        spacy_model = models[lang]
-    except KeyError:
-        raise ValueError(f"Model {lang}_core_news_md is not currently supported.")
-    return spacy_model
+    return registry.get(lang)
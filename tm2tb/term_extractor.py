@@ -1,83 +1,94 @@
 """Extract terms from a sentence or multiple sentences."""
 
 import os
-import re
+import math
+import multiprocessing
 from collections import defaultdict
 from typing import List
 from functools import cached_property
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 from spacy.tokens import Span
-from spacy.matcher import Matcher
-from tm2tb import trf_model
-from tm2tb import get_spacy_model
+from spacy.util import filter_spans
+from tm2tb.language_resources import get_language_resources
+from tm2tb.encoding import encode_texts, fits_max_seq_length
+from tm2tb.doc_chunks import sentence_chunks, sample_chunks
+from tm2tb.term_table import TermTable
+from tm2tb.clustering import cluster_embeddings
+from tm2tb.similarity import normalize_rows
 from tm2tb.utils import detect_lang
-from sklearn.cluster import KMeans
+
+NLP_BATCH_SIZE = int(os.environ.get("TM2TB_NLP_BATCH_SIZE", 256))
+NLP_PROCESSES = int(os.environ.get("TM2TB_NLP_PROCESSES", 1))
+NLP_PROCESS_MIN_TEXTS = int(os.environ.get("TM2TB_NLP_PROCESS_MIN_TEXTS", 500))
+CHUNK_CHARS = int(os.environ.get("TM2TB_CHUNK_CHARS", 100000))
+
+# Register the span attributes once, at import time. Re-registering them for
+# each extractor is not safe while other threads are extracting terms.
+for extension in ("similarity", "rank", "cluster", "span_id", "embedding", "frequency", "docs_idx"):
+    if not Span.has_extension(extension):
+        Span.set_extension(extension, default=None)
 
 
 class TermExtractor:
-    """Class representing a term extractor."""
-    def __init__(self, texts: List[str], lang=None):
+    """
+    Class representing a term extractor.
+
+    Parameters
+    ----------
+    texts : List[str]
+        Texts to extract the terms from.
+    lang : str, optional
+        Two-character language identifier. Detected from the texts if None.
+    batch_size : int, optional
+        Number of texts parsed by spaCy at once. The default is TM2TB_NLP_BATCH_SIZE.
+    n_process : int, optional
+        Number of processes parsing the texts. If None, one process is added for
+        every TM2TB_NLP_PROCESS_MIN_TEXTS texts, up to TM2TB_NLP_PROCESSES.
+    """
+    def __init__(self, texts: List[str], lang=None, batch_size=NLP_BATCH_SIZE, n_process=None):
         self.texts = texts
+        self.batch_size = batch_size
+        self.n_process = n_process
         if lang is None:
             self.lang = detect_lang(self.texts)
         else:
             self.lang = lang
-        Span.set_extension("similarity", default=None, force=True)
-        Span.set_extension("rank", default=None, force=True)
-        Span.set_extension("cluster", default=None, force=True)
-        Span.set_extension("span_id", default=None, force=True)
-        Span.set_extension("embedding", default=None, force=True)
-        Span.set_extension("frequency", default=None, force=True)
-        Span.set_extension("docs_idx", default=None, force=True)
 
     @cached_property
+    def resources(self):
+        """Matcher and stopwords of the language, shared by all extractors."""
+        return get_language_resources(self.lang)
+
+    @property
     def frequent_nouns(self):
-        path = os.path.join('stopwords', f'{self.lang}_frequent_nouns.txt')
-        with open(path, 'r', encoding='utf8') as fw:
-            return fw.read().split('\n')
+        return self.resources.frequent_nouns
 
-    @cached_property
+    @property
     def frequent_adjs(self):
-        path = os.path.join('stopwords', f'{self.lang}_frequent_adjs.txt')
-        with open(path, 'r', encoding='utf8') as fw:
-            return fw.read().split('\n')
+        return self.resources.frequent_adjs
 
-    @cached_property
+    @property
     def matcher(self):
-        noun = {'POS': {'IN': ['NOUN']}, 'IS_PUNCT': False, 'LIKE_NUM': False}
-        adj = {'POS': 'ADJ', 'IS_PUNCT': False, 'OP': '*'}
-        adp = {'POS': 'ADP', 'IS_PUNCT': False}
-        nVj = {'POS': {'IN': ['ADJ', 'NOUN']}, 'OP': '*', 'IS_PUNCT': False, 'LIKE_NUM': False}
-
-        noun_final = [[nVj, noun], [nVj, noun, adp, nVj, noun]]
-        noun_initial = [[noun, nVj], [noun, nVj, adp, noun, nVj]]
-
-        PATTERNS = {
-            'en': noun_final,
-            'de': [[adj, noun], [noun, noun]],
-            'fr': noun_initial,
-            'es': noun_initial,
-            'it': noun_initial,
-            'pt': noun_initial
-            }
-        patterns = PATTERNS[self.lang]
-        matcher = Matcher(self.nlp.vocab)
-        for i, pattern in enumerate(patterns):
-            matcher.add(f"{i}", [pattern])
-        return matcher
+        return self.resources.matcher
 
-    @cached_property
+    @property
     def nlp(self):
         """Spacy lang model."""
-        return get_spacy_model(self.lang)
+        return self.resources.nlp
 
     def extract_terms(self,
                       span_range=(1, 2),
                       freq_min=1,
                       term_length_min=2,
                       filter_stopwords=True,
-                      include_entities=False):
+                      include_entities=False,
+                      match_policy='all',
+                      ranking='simple',
+                      top_n=None,
+                      diversity=.9,
+                      cluster_method='kmeans',
+                      return_table=False):
         """
         Parameters
         ----------
@@ -91,23 +102,207 @@ class TermExtractor:
             If True, terms that contain a stopword are discarded. The default is True
         include_entities : bool, optional
             If True, the document entities are added to the terms results. The default is False
+        match_policy : str, optional
+            'all' keeps every pattern match, including the matches nested in longer ones.
+            'longest' keeps the longest non-overlapping matches. The default is 'all'
+        ranking : str, optional
+            'simple' ranks the terms by their similarity to the docs and their frequency.
+            'mmr' (Maximal Marginal Relevance) keeps the rank of top_n diverse terms, halves the rank
+            of the others and sorts the terms by rank. The default is 'simple'
+        top_n : int, optional
+            Number of terms selected by the 'mmr' ranking, 0 or more. The default is half of the terms.
+        diversity : float, optional
+            Weight of the diversity of the terms selected by the 'mmr' ranking, between 0 and 1. The default is .9
+        cluster_method : str, optional
+            'kmeans', 'minibatch', 'agglomerative', 'leader', 'auto', or None to skip clustering.
+            The default is 'kmeans'
+        return_table : bool, optional
+            If True, the terms are returned as a TermTable instead of spans. The default is False
         Returns
         -------
-        spans : List of spacy.tokens.span.Span objects
+        spans : List of spacy.tokens.span.Span objects, or TermTable
             A list of spans representing the terms from the document.
         """
+        # Encode the doc chunks and the spans in a single pass, storing only the span embeddings
+        chunks, chunks_weights, spans = self.extract_candidates(span_range=span_range,
+                                                                freq_min=freq_min,
+                                                                term_length_min=term_length_min,
+                                                                filter_stopwords=filter_stopwords,
+                                                                include_entities=include_entities,
+                                                                match_policy=match_policy)
+        embeddings = encode_texts(chunks + [span.text for span in spans],
+                                  persist=[False] * len(chunks) + [True] * len(spans))
+        return self.score_candidates(spans, embeddings[:len(chunks)], embeddings[len(chunks):],
+                                     docs_weights=chunks_weights, ranking=ranking, top_n=top_n,
+                                     diversity=diversity, cluster_method=cluster_method,
+                                     return_table=return_table)
+
+    def extract_candidates(self,
+                           span_range=(1, 2),
+                           freq_min=1,
+                           term_length_min=2,
+                           filter_stopwords=True,
+                           include_entities=False,
+                           match_policy='all'):
+        """
+        Parse the texts and select the term candidates, before any embedding is computed.
+
+        Texts longer than TM2TB_CHUNK_CHARS characters are parsed in windows. The docs
+        are released as soon as their candidates and sentence chunks are collected.
+
+        See extract_terms for the parameters.
+
+        Returns
+        -------
+        chunks : List[str]
+            The texts that the model encodes whole, and sentence chunks of the longer
+            texts, for the doc embedding (see tm2tb.doc_chunks).
+        chunks_weights : numpy.ndarray
+            Weight of each chunk, so that each text weighs the same.
+        spans : List of spacy.tokens.span.Span objects
+            The filtered and trimmed term candidates.
+        """
+        def keep(span):
+            # The filters that only depend on the span, applied before a span is copied out of a window
+            return (len(span.text) >= term_length_min and span_range[0] <= len(span) <= span_range[1]
+                    and (filter_stopwords is False
+                         or not self._is_stopword_span(span, self.frequent_nouns, self.frequent_adjs)))
+
+        chunks = []
+        docs = self._parse(include_entities, chunks)
+        spans, spans_occurrences = self._collect_spans(docs, include_entities, span_range, match_policy, keep)
+        chunks, chunks_weights = sample_chunks(chunks)
+
+        # Use the passed parameters to filter the spans
+        spans = filter(lambda term: len(term.text) >= term_length_min, spans)
+        spans = filter(lambda term: term._.frequency >= freq_min, spans)
+        spans = filter(lambda span: span_range[0] <= len(span) <= span_range[1], spans)
+        spans = list(spans)
+        if filter_stopwords is True:
+            spans = self._filter_stopwords(spans)
+
+        # Trim spans
+        spans = self._trim_spans(spans, spans_occurrences)
+        return chunks, chunks_weights, spans
+
+    def _parse(self, include_entities, chunks):
+        """
+        Parse the texts, window by window.
+
+        Yields
+        ------
+        doc, (doc_id, offset, windowed) : spacy.tokens.doc.Doc, tuple
+            A parsed window, the index of its text, its character offset in the text,
+            and whether the text was cut in several windows.
+            The doc index, text and number of tokens of the sentence chunks of each
+            doc are appended to chunks.
+        """
         # Normalize whitespace
         texts = [' '.join(text.split()) for text in self.texts]
-        # Get docs and doc embedding average
-        docs = list(self.nlp.pipe(texts))
-        docs_embeddings_avg = sum((trf_model.encode([doc.text for doc in docs]))/len(docs)).reshape(1, -1)
+        windows = [(window, (doc_id, offset, len(text) > CHUNK_CHARS)) for doc_id, text in enumerate(texts)
+                   for offset, window in self._text_windows(text)]
+        # Run only the pipeline components that the request needs. The components are
+        # disabled for this call only: select_pipes would modify the shared model.
+        docs = self.nlp.pipe(windows, as_tuples=True, disable=self.resources.disabled_pipes(include_entities),
+                             **self._pipe_kwargs([window for window, _ in windows]))
+        for doc, (doc_id, offset, windowed) in docs:
+            # A text that the model encodes whole is its own chunk
+            if not windowed and fits_max_seq_length(doc.text, len(doc)):
+                doc_chunks = [(doc.text, len(doc))]
+            else:
+                doc_chunks = sentence_chunks(doc)
+            chunks.extend((doc_id, text, n_tokens) for text, n_tokens in doc_chunks)
+            yield doc, (doc_id, offset, windowed)
+
+    @staticmethod
+    def _text_windows(text, chunk_chars=CHUNK_CHARS):
+        """
+        Cut a text in windows of up to chunk_chars characters.
+
+        The windows end after a sentence if possible, or else at a space.
+
+        Yields
+        ------
+        offset, window : int, str
+            Character offset of the window in the text, and the window.
+        """
+        start = 0
+        while len(text) - start > chunk_chars:
+            end = start + chunk_chars
+            cut = max(text.rfind(punct, start, end) for punct in ('. ', '? ', '! '))
+            if cut > start:
+                # Keep the punctuation in the window
+                cut += 1
+            else:
+                cut = text.rfind(' ', start, end)
+                if cut <= start:
+                    cut = end
+            yield start, text[start:cut]
+            start = cut + 1 if text[cut] == ' ' else cut
+        yield start, text[start:]
+
+    def _pipe_kwargs(self, texts):
+        """
+        Batch size and number of processes of nlp.pipe.
+
+        Small inputs are parsed in this process. Daemonic processes, such as the
+        extraction pool workers, cannot start children and always use one process.
+        With several processes, the batches are made small enough to keep them all busy.
+        A batch holds up to TM2TB_CHUNK_CHARS characters, to bound the memory of long texts.
+        """
+        n_texts = len(texts)
+        if self.n_process is None:
+            n_process = min(NLP_PROCESSES, n_texts // NLP_PROCESS_MIN_TEXTS)
+        else:
+            n_process = self.n_process
+        if multiprocessing.current_process().daemon:
+            n_process = 1
+        n_process = max(1, n_process)
+        batch_size = self.batch_size
+        if n_process > 1:
+            batch_size = max(1, min(batch_size, math.ceil(n_texts / n_process)))
+        longest = max((len(text) for text in texts), default=0)
+        batch_size = max(1, min(batch_size, CHUNK_CHARS // max(1, longest)))
+        return {'batch_size': batch_size, 'n_process': n_process}
+
+    def _collect_spans(self, docs, include_entities=False, span_range=None, match_policy='all', keep=None):
+        """
+        Collect the candidate spans of the docs, with their frequencies and docs ids.
+
+        The pattern matches are limited to span_range when they are generated, and
+        the occurrences of the windows of a text are merged. The candidates of windowed
+        texts that pass keep are copied out of their window, so that each window can
+        be released after it is read; the others are only counted.
 
-        # Collect spans, their frequencies and docs ids.
+        Parameters
+        ----------
+        docs : Iterable
+            (doc, (doc_id, offset, windowed)) pairs, see _parse.
+        keep : callable, optional
+            Filter of the candidates of windowed texts. The default keeps them all.
+
+        Returns
+        -------
+        spans : List of spacy.tokens.span.Span objects
+            The first occurrence of each distinct candidate.
+        spans_occurrences : dict
+            (doc_id, start_char, end_char) of every occurrence of each candidate text.
+        """
+        if match_policy not in ('all', 'longest'):
+            raise ValueError(f"Unknown match policy: {match_policy}")
+        matcher = self.matcher if span_range is None else self.resources.bounded_matcher(span_range)
         spans = []
-        spans_freqs_dict = defaultdict(int)
-        spans_docs_dict = defaultdict(set)
+        spans_occurrences = defaultdict(list)
+
+        def add(span):
+            if span.text not in spans_occurrences:
+                if not windowed:
+                    spans.append(span)
+                elif keep is None or keep(span):
+                    spans.append(self._compact_span(span))
+            spans_occurrences[span.text].append((doc_id, offset + span.start_char, offset + span.end_char))
 
-        for doc_id, doc in enumerate(docs):
+        for doc, (doc_id, offset, windowed) in docs:
 
             if include_entities is True:
                 stop_tags = {'DET', 'PUNCT', 'AUX', 'VERB', 'NUM'}
@@ -115,137 +310,140 @@ class TermExtractor:
                 for ent in list(doc.ents):
                     # Disregard entities with determiners, punctuation, verbs and also numeric entities
                     if all(token.pos_ not in stop_tags for token in ent) and not ent.label_ in stop_labels:
-                        if ent.text not in spans_freqs_dict.keys():
-                            spans.append(ent)
-                        spans_freqs_dict[ent.text] += 1
-                        spans_docs_dict[ent.text].add(doc_id)
+                        add(ent)
 
             # Select POS-pattern-matched spans
-            matches = self.matcher(doc)
-            for (_, start, end) in matches:
-                span = doc[start:end]
-                if span.text not in spans_freqs_dict.keys():
-                    spans.append(span)
-                spans_freqs_dict[span.text] += 1
-                spans_docs_dict[span.text].add(doc_id)
+            matches = [doc[start:end] for (_, start, end) in matcher(doc)]
+            if match_policy == 'longest':
+                matches = filter_spans(matches)
+            for span in matches:
+                add(span)
 
         # Add frequency and doc id data to spans
         for span in spans:
-            span._.frequency = spans_freqs_dict[span.text]
-            span._.docs_idx = spans_docs_dict[span.text]
+            occurrences = spans_occurrences[span.text]
+            span._.frequency = len(occurrences)
+            span._.docs_idx = {doc_id for doc_id, _, _ in occurrences}
+        return spans, spans_occurrences
 
-        # Use the passed parameters to filter the spans
-        spans = filter(lambda term: len(term.text) >= term_length_min, spans)
-        spans = filter(lambda term: term._.frequency >= freq_min, spans)
-        spans = filter(lambda span: span_range[0] <= len(span) <= span_range[1], spans)
-        spans = list(spans)
-        if filter_stopwords is True:
-            spans = self._filter_stopwords(spans)
+    @staticmethod
+    def _compact_span(span):
+        """Copy a span into a doc of its own, which does not keep the whole parsed text alive."""
+        return Span(span.as_doc(), 0, len(span), label=span.label_)
 
-        # Trim spans
-        spans = self._trim_spans(spans, texts)
+    def score_candidates(self, spans, docs_embeddings, spans_embeddings, docs_weights=None,
+                         ranking='simple', top_n=None, diversity=.9, cluster_method='kmeans', return_table=False):
+        """
+        Rank and cluster the term candidates using their embeddings.
 
-        # Get spans embeddings
-        spans_embeddings = trf_model.encode([s.text for s in spans])
+        Parameters
+        ----------
+        spans : List of spacy.tokens.span.Span objects
+            The term candidates returned by extract_candidates.
+        docs_embeddings : numpy.ndarray
+            One embedding per doc, or per doc chunk (see tm2tb.doc_chunks).
+        spans_embeddings : numpy.ndarray
+            One embedding per span.
+        docs_weights : numpy.ndarray, optional
+            Weight of each doc embedding in the mean doc embedding. The default is equal weights.
+        ranking, top_n, diversity, cluster_method : optional
+            See extract_terms.
+        return_table : bool, optional
+            If True, the terms are returned as a TermTable instead of spans. The default is False
+
+        Returns
+        -------
+        spans : List of spacy.tokens.span.Span objects, or TermTable
+            A list of spans representing the terms from the document.
+        """
+        if ranking not in ('simple', 'mmr'):
+            raise ValueError(f"Unknown ranking: {ranking}")
+        if top_n is not None and top_n < 0:
+            raise ValueError(f"top_n must not be negative: {top_n}")
+        if not 0 <= diversity <= 1:
+            raise ValueError(f"diversity must be between 0 and 1: {diversity}")
+
+        table = TermTable.from_spans(spans, normalize_rows(spans_embeddings))
+        docs_embeddings_avg = np.average(docs_embeddings, axis=0, weights=docs_weights).reshape(1, -1)
 
         # Get doc/spans similarities
-        spans_doc_similarities = cosine_similarity(spans_embeddings, docs_embeddings_avg)
-        for idx, span in enumerate(spans):
-            span._.similarity = round(float(spans_doc_similarities.reshape(1, -1)[0][idx]), 4)
-            span._.embedding = spans_embeddings[idx]
+        similarities = cosine_similarity(table.embeddings, docs_embeddings_avg).reshape(-1)
+        table.similarities = np.round(similarities.astype(np.float64), 4)
 
         # Rank spans
-        spans = self._simple_rank(spans)
+        table.ranks = self._simple_rank(table.similarities, table.frequencies)
+        if ranking == 'mmr' and len(table) > 0:
+            table.ranks = self._mmr_rank(table.embeddings, similarities, table.ranks, top_n, diversity)
+            table = table.take(np.argsort(-table.ranks, kind='stable'))
 
         # Cluster spans
-        spans = self._cluster_spans(spans)
-        
-        # Assign span id and return spans
-        for span_id, span in enumerate(spans):
-            span._.span_id = span_id
-
-        return spans
-
-    def _cluster_spans(self, spans):
-        n_clusters = round(len(spans)*.3)
-        embs = [span._.embedding for span in spans]
-        cluster_labels = KMeans(n_clusters=n_clusters, random_state=0).fit(embs).labels_
-        for idx, label in enumerate(cluster_labels):
-            spans[idx]._.cluster = label
-        return spans
+        table.clusters = cluster_embeddings(table.embeddings, method=cluster_method)
+
+        if return_table is True:
+            return table
+        return table.to_spans()
 
     def _filter_stopwords(self, spans):
         # Keep spans if none of its (lower-cased) tokens' lemmas is in stopwords.
-        spans_ = []
-        for span in spans:
-            # Filter if span is non-entity
-            if span.label_ == '':
-                # filter if term lemma is in frequent nouns or if any frequent adjective is in the lemmatized term
-                if span.lemma_.lower() not in self.frequent_nouns \
-                        and not set([tok.lemma_.lower() for tok in span]) & set(self.frequent_adjs):
-                    spans_.append(span)
-            else:
-                spans_.append(span)
+        frequent_nouns = self.frequent_nouns
+        frequent_adjs = self.frequent_adjs
+        spans_ = [span for span in spans if not self._is_stopword_span(span, frequent_nouns, frequent_adjs)]
         if len(spans_) == 0:
             raise ValueError('No terms found.')
         return spans_
 
-    def _trim_spans(self, spans, texts):
-        # When a term is a subset of another term for any given "span", only keep the longer term
-        spans_indices =  [[m.start(0) for m in re.finditer(span.text, texts[0])] for span in spans]
-        term_lens = [len(span.text) for span in spans]
-        longest_match_span = max(term_lens)
-        candidates = [m for i, m in enumerate(spans) if term_lens[i] < longest_match_span]
-        match_spans = set()
-        for i, matches in enumerate(spans_indices):
-            for idx in matches:
-                match_spans.add(tuple(range(idx, idx + term_lens[i])))
-        for cand in candidates:
-            idx = spans.index(cand)
-            cand_spans = [tuple(range(x, x + term_lens[idx])) for x in spans_indices[idx]]
-            for cand_span in cand_spans:
-                for match_span in match_spans - {cand_span}:
-                    if all(x in match_span for x in cand_span):
-                        try:
-                            spans_indices[idx].remove(cand_span[0])
-                        except ValueError:
-                            pass
-        return [spans[i] for i in range(len(spans)) if len(spans_indices[i])>0]
+    @staticmethod
+    def _is_stopword_span(span, frequent_nouns, frequent_adjs):
+        # Entities are kept. Other spans are filtered if their lemma is a frequent noun
+        # or if any frequent adjective is in the lemmatized term.
+        return span.label_ == '' and (span.lemma_.lower() in frequent_nouns
+                                      or any(tok.lemma_.lower() in frequent_adjs for tok in span))
+
+    @staticmethod
+    def _trim_spans(spans, spans_occurrences):
+        # When a term occurrence is contained in the occurrence of another term, only keep the longer term.
+        # A term is kept if at least one of its occurrences is not contained in another one.
+        # Sweep the distinct occurrences by doc, start (ascending) and end (descending): an occurrence
+        # is contained in a previous one if one of them ends at or after its end.
+        occurrences = sorted({occurrence for span in spans for occurrence in spans_occurrences[span.text]},
+                             key=lambda occurrence: (occurrence[0], occurrence[1], -occurrence[2]))
+        contained = set()
+        doc_id, max_end = None, -1
+        for occurrence in occurrences:
+            if occurrence[0] != doc_id:
+                doc_id, max_end = occurrence[0], -1
+            if max_end >= occurrence[2]:
+                contained.add(occurrence)
+            else:
+                max_end = occurrence[2]
+        return [span for span in spans
+                if any(occurrence not in contained for occurrence in spans_occurrences[span.text])]
 
     @staticmethod
-    def _simple_rank(spans):
+    def _simple_rank(similarities, frequencies):
         # Define rank as term-to-doc similarity plus normalized term frequency
-        for span in spans:
-            span._.rank = span._.similarity * 1/(1 + np.exp(-span._.frequency))
-        return spans
+        return similarities * (1/(1 + np.exp(-frequencies)))
 
     @staticmethod
-    def _mmr_rank(spans, spans_doc_sims):
-        # Rank terms using Maximal Marginal Relevance
-        top_n = round(len(spans)/2)
-        diversity = .9
-        spans_sims = cosine_similarity([sp._.embedding for sp in spans])
-        best_spans_idx = [np.argmax(spans_doc_sims)]
-        candidates_idx = [i for i in range(len(spans)) if i != best_spans_idx[0]]
-        for _ in range(min(top_n - 1, len(spans) - 1)):
-            candidate_sims = spans_doc_sims[candidates_idx, :]
-            rest_spans_sims = np.max(spans_sims[candidates_idx][:, best_spans_idx], axis=1)
-            # Calculate Maximum Marginal Relevance
-            mmr = (1-diversity) * candidate_sims - diversity * rest_spans_sims.reshape(-1, 1)
-            # Get best candidate
-            mmr_idx = candidates_idx[np.argmax(mmr)]
-            # Update best spans & candidates
-            best_spans_idx.append(mmr_idx)
-            candidates_idx.remove(mmr_idx)
-
-        # Add rank to spans
-        for span in spans:
-            idx = spans.index(span)
-            if idx in best_spans_idx:
-                span = spans[idx]
-                span._.rank = span._.similarity * 1/(1 + np.exp(-span._.frequency))
-            if idx in candidates_idx:
-                span = spans[idx]
-                span._.rank = (span._.similarity * 1/(1 + np.exp(-span._.frequency))) * .5
-        spans = sorted(spans, key=lambda span: span._.rank, reverse=True)
-        return spans
+    def _mmr_rank(embeddings, doc_similarities, ranks, top_n=None, diversity=.9):
+        # Rank terms using Maximal Marginal Relevance: the top_n selected terms keep their rank,
+        # the other terms get half of it.
+        # The maximum similarity of each term to the selected terms is updated after each selection,
+        # so that a selection step costs one matrix-vector product.
+        n = len(embeddings)
+        if top_n is None:
+            top_n = round(n/2)
+        if top_n == 0:
+            return ranks * .5
+        normalized = normalize_rows(embeddings)
+        selected = np.zeros(n, dtype=bool)
+        best = int(np.argmax(doc_similarities))
+        selected[best] = True
+        max_similarities = normalized @ normalized[best]
+        for _ in range(min(top_n - 1, n - 1)):
+            mmr = (1-diversity) * doc_similarities - diversity * max_similarities
+            mmr[selected] = -np.inf
+            best = int(np.argmax(mmr))
+            selected[best] = True
+            np.maximum(max_similarities, normalized @ normalized[best], out=max_similarities)
+        return np.where(selected, ranks, ranks * .5)
@@ -0,0 +1,128 @@
+"""
+Columnar representation of extracted terms.
+
+Classes:
+    TermTable
+"""
+import numpy as np
+
+
+class TermTable:
+    """
+    Terms and their metadata stored as parallel arrays.
+
+    Row i of every column describes the same term. The spaCy spans are kept
+    so that they can be materialized on demand with `to_spans`.
+
+    Attributes
+    ----------
+    texts : numpy.ndarray
+        Term strings.
+    lemmas : numpy.ndarray
+        Term lemmas.
+    labels : numpy.ndarray
+        Entity labels ('' for pattern-matched terms).
+    tags : List[List[str]]
+        Part-of-speech tags of the tokens of each term.
+    frequencies : numpy.ndarray
+        Occurrence frequencies (int).
+    docs_idx : List[set]
+        Ids of the docs where each term occurs.
+    embeddings : numpy.ndarray
+        Embedding matrix, one row per term.
+    similarities : numpy.ndarray
+        Term-to-doc similarities (float), or None before scoring.
+    ranks : numpy.ndarray
+        Term ranks (float), or None before scoring.
+    clusters : numpy.ndarray
+        Cluster labels (int), or None before clustering.
+    spans : List[spacy.tokens.span.Span]
+        The spans the terms were extracted from.
+    """
+
+    columns = ('texts', 'lemmas', 'labels', 'tags', 'frequencies', 'docs_idx',
+               'embeddings', 'similarities', 'ranks', 'clusters', 'spans')
+
+    def __init__(self, texts, lemmas, labels, tags, frequencies, docs_idx, embeddings,
+                 similarities=None, ranks=None, clusters=None, spans=None):
+        self.texts = texts
+        self.lemmas = lemmas
+        self.labels = labels
+        self.tags = tags
+        self.frequencies = frequencies
+        self.docs_idx = docs_idx
+        self.embeddings = embeddings
+        self.similarities = similarities
+        self.ranks = ranks
+        self.clusters = clusters
+        self.spans = spans
+
+    @classmethod
+    def from_spans(cls, spans, embeddings):
+        """
+        Build a table from candidate spans and their embeddings.
+
+        Parameters
+        ----------
+        spans : List[spacy.tokens.span.Span]
+            Candidate spans, with their frequency and docs_idx extensions set.
+        embeddings : numpy.ndarray
+            One embedding per span.
+        """
+        return cls(texts=np.array([span.text for span in spans], dtype=object),
+                   lemmas=np.array([span.lemma_ for span in spans], dtype=object),
+                   labels=np.array([span.label_ for span in spans], dtype=object),
+                   tags=[[token.pos_ for token in span] for span in spans],
+                   frequencies=np.array([span._.frequency for span in spans], dtype=int),
+                   docs_idx=[span._.docs_idx for span in spans],
+                   embeddings=np.asarray(embeddings),
+                   spans=list(spans))
+
+    def __len__(self):
+        return len(self.texts)
+
+    def take(self, idx):
+        """
+        Return a new table with the selected rows.
+
+        Parameters
+        ----------
+        idx : numpy.ndarray
+            Row indices or boolean mask.
+        """
+        idx = np.asarray(idx)
+        if idx.dtype == bool:
+            idx = np.flatnonzero(idx)
+        values = {}
+        for column in self.columns:
+            value = getattr(self, column)
+            if value is None:
+                values[column] = None
+            elif isinstance(value, np.ndarray):
+                values[column] = value[idx]
+            else:
+                values[column] = [value[i] for i in idx]
+        return TermTable(**values)
+
+    def to_spans(self):
+        """Materialize the terms as spans, with their metadata in the span extensions."""
+        for span_id, span in enumerate(self.spans):
+            span._.similarity = float(self.similarities[span_id]) if self.similarities is not None else None
+            span._.rank = self.ranks[span_id] if self.ranks is not None else None
+            span._.cluster = self.clusters[span_id] if self.clusters is not None else None
+            span._.embedding = self.embeddings[span_id]
+            span._.frequency = int(self.frequencies[span_id])
+            span._.docs_idx = self.docs_idx[span_id]
+            span._.span_id = span_id
+        return list(self.spans)
+
+    def to_dicts(self):
+        """Return the terms as a list of dicts of plain Python values."""
+        return [{'term': self.texts[i],
+                 'lemma': self.lemmas[i],
+                 'label': self.labels[i],
+                 'tags': self.tags[i],
+                 'similarity': float(self.similarities[i]),
+                 'rank': float(self.ranks[i]),
+                 'frequency': int(self.frequencies[i]),
+                 'cluster': int(self.clusters[i])} for i in range(len(self))]
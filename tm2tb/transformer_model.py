@@ -2,7 +2,15 @@
 Load transformer model
 """
 import os
-from sentence_transformers import SentenceTransformer
+import time
+import threading
+import importlib
+from contextlib import contextmanager
+from functools import partial
+from tm2tb.file_lock import file_lock
+
+TRANSFORMER_BACKEND = os.environ.get("TM2TB_TRANSFORMER_BACKEND", "torch")
+TRANSFORMER_PRELOAD = os.environ.get("TM2TB_TRANSFORMER_PRELOAD", "false").lower() == "true"
 
 
 class TransformerModel:
@@ -30,21 +38,194 @@ class TransformerModel:
 
         paraphrase-multilingual-mpnet-base-v2
 
+    Backends:
+
+        torch (default): full-precision PyTorch model.
+
+        onnx: ONNX export of the model, dynamically quantized to int8 and run
+        with onnxruntime. It is exported from the torch model on first use.
+
     """
-    def __init__(self, model_name):
+    def __init__(self, model_name, backend=TRANSFORMER_BACKEND):
+        if backend not in ('torch', 'onnx'):
+            raise ValueError(f"Transformer backend {backend} is not supported.")
         self.path = 'sbert_models'
         self.model_name = model_name
+        self.backend = backend
         self.model_path = os.path.join(self.path, self.model_name)
+        self.onnx_model_path = os.path.join(self.path, f'{self.model_name}-onnx-int8')
+        self.timings = {}
         if self.path not in os.listdir():
             os.mkdir(self.path)
 
+    @property
+    def encoder_name(self):
+        """Name identifying the embeddings produced by this model and backend."""
+        if self.backend == 'onnx':
+            return f'{self.model_name}-onnx-int8'
+        return self.model_name
+
+    @contextmanager
+    def _timed(self, phase):
+        # Record the duration of a startup phase, in seconds
+        start = time.perf_counter()
+        yield
+        self.timings[phase] = round(time.perf_counter() - start, 3)
+
+    def load_lazy(self):
+        """Return a proxy that loads the model on first use."""
+        return LazyTransformerModel(self)
+
     def load(self):
+        """Load the model with the configured backend."""
+        if self.backend == 'onnx':
+            return self._load_onnx()
+        return self._load_torch()
+
+    def _load_onnx(self):
+        from tm2tb.onnx_model import OnnxSentenceEncoder
+        # The config file is written last, so a partial export is redone
+        if not os.path.exists(os.path.join(self.onnx_model_path, OnnxSentenceEncoder.config_file)):
+            print('Exporting sentence transformer model to ONNX:\n{}'.format(self.model_name))
+            OnnxSentenceEncoder.export(self._load_torch(), self.onnx_model_path)
+        print('Loading ONNX sentence transformer model:\n{}'.format(self.model_name))
+        model = OnnxSentenceEncoder(self.onnx_model_path)
+        self.timings.update(model.timings)
+        return model
+
+    def _load_torch(self):
         """Load model from path or download it from HuggingFace Model Hub."""
+        with self._timed('torch_import'):
+            import torch  # noqa: F401
+        with self._timed('sentence_transformers_import'):
+            from sentence_transformers import SentenceTransformer
         if self.model_name in os.listdir(self.path):
+            self._convert_to_safetensors()
             print('Loading sentence transformer model:\n{}'.format(self.model_name))
-            model = SentenceTransformer(self.model_path)
+            start = time.perf_counter()
+            with self._timed_loaders():
+                model = SentenceTransformer(self.model_path)
+            # Config, pooling and dense layers
+            self.timings['modules'] = round(time.perf_counter() - start
+                                            - self.timings['tokenizer'] - self.timings['weights'], 3)
         else:
             print('Downloading sentence transformer model:\n{}'.format(self.model_name))
             model = SentenceTransformer(self.model_name)
             model.save(self.model_path)
+            self._convert_to_safetensors()
         return model
+
+    @contextmanager
+    def _timed_loaders(self):
+        """
+        Time the tokenizer and the weights loaded by the SentenceTransformer constructor.
+
+        Both are loaded by its Transformer module, with AutoTokenizer and AutoModel,
+        which are replaced while the model loads by loaders recording their duration
+        as the 'tokenizer' and 'weights' phases.
+        """
+        module = importlib.import_module('sentence_transformers.models.Transformer')
+        loaders = {'AutoTokenizer': 'tokenizer', 'AutoModel': 'weights'}
+        originals = {name: getattr(module, name) for name in loaders}
+        for name, phase in loaders.items():
+            self.timings[phase] = 0
+            setattr(module, name, _TimedLoader(originals[name], partial(self._timed, phase)))
+        try:
+            yield
+        finally:
+            for name, loader in originals.items():
+                setattr(module, name, loader)
+
+    def _convert_to_safetensors(self):
+        """
+        Convert the saved transformer weights from a pickled PyTorch checkpoint to safetensors.
+
+        safetensors files are read without unpickling, which skips the pickle
+        machinery and does not run code from the checkpoint. The tensors are still
+        copied into the parameters of the model, so every process holds its own
+        copy of the weights: nothing stays memory-mapped or shared between workers.
+        The 'weights' startup phase measures the load time with either format.
+        transformers loads model.safetensors in preference to the checkpoint,
+        which is kept. The conversion is skipped if safetensors (or a transformers
+        version that loads it) is not installed.
+
+        Workers starting at the same time convert the weights once: the conversion
+        holds a lock file, and the file is written under a per-process name before
+        being renamed into place.
+        """
+        bin_path = os.path.join(self.model_path, 'pytorch_model.bin')
+        safetensors_path = os.path.join(self.model_path, 'model.safetensors')
+        if not os.path.exists(bin_path) or os.path.exists(safetensors_path):
+            return
+        try:
+            import torch
+            from safetensors.torch import save_file
+            # Only transformers versions that know this name load safetensors weights
+            from transformers.utils import SAFE_WEIGHTS_NAME  # noqa: F401
+        except ImportError:
+            return
+        with file_lock(os.path.join(self.path, f'{self.model_name}.lock')):
+            # Another process may have converted the weights while we waited
+            if os.path.exists(safetensors_path):
+                return
+            print('Converting sentence transformer weights to safetensors:\n{}'.format(self.model_name))
+            state_dict = torch.load(bin_path, map_location='cpu')
+            tmp_path = f'{safetensors_path}.{os.getpid()}.tmp'
+            # safetensors does not store shared tensors; transformers re-ties them on load
+            save_file({name: tensor.contiguous().clone() for name, tensor in state_dict.items()},
+                      tmp_path, metadata={'format': 'pt'})
+            os.replace(tmp_path, safetensors_path)
+
+
+class _TimedLoader:
+    """Proxy of a transformers Auto class that times its from_pretrained calls."""
+    def __init__(self, loader, timed):
+        self._loader = loader
+        self._timed = timed
+
+    def from_pretrained(self, *args, **kwargs):
+        with self._timed():
+            return self._loader.from_pretrained(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class LazyTransformerModel:
+    """
+    Proxy of a transformer model that is loaded on first use.
+
+    Attributes
+    ----------
+    transformer_model : TransformerModel
+        The model to load.
+    """
+    def __init__(self, transformer_model):
+        self.transformer_model = transformer_model
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self):
+        return self._model is not None
+
+    @property
+    def model(self):
+        """The loaded model."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self.transformer_model.load()
+        return self._model
+
+    def preload(self):
+        """Load the model now instead of on first use."""
+        return self.model
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    def encode(self, sentences, **kwargs):
+        return self.model.encode(sentences, **kwargs)